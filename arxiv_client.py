@@ -0,0 +1,217 @@
+"""
+Shared HTTP access to the arXiv API.
+
+All harvesters go through `fetch`/`fetch_stream`, which hold one of a fixed
+number of connection slots while the response downloads and, once inside the
+slot, take a token from one process-wide token bucket. Taking the token last
+means threads queued behind a slow download do not bank tokens and then fire
+together when the slot frees up. The defaults follow arXiv's API terms (one
+request every three seconds, a single connection at a time). `fetch_stream` keeps its
+slot until the caller has consumed the body, so streamed parsing overlaps the
+download inside the slot; a slow parser delays the next request. DB work comes
+after the page is parsed, outside the slot.
+
+Every request goes through one keep-alive session, and response bodies are kept
+in an on-disk cache keyed by URL. Within ARXIV_CACHE_TTL a cached page is served
+without touching the network, so re-running a half-failed harvest is mostly cache
+hits; older entries are revalidated with If-None-Match / If-Modified-Since when
+the server sent an ETag or Last-Modified. Pages that are never asked for twice
+(backfill segments, OAI-PMH resumption pages) pass ttl=None and bypass the cache.
+
+ARXIV_API_URL can point at a local stand-in server for testing.
+"""
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+ARXIV_API_URL = os.getenv("ARXIV_API_URL", "http://export.arxiv.org/api/query")
+REQUEST_INTERVAL = float(os.getenv("ARXIV_REQUEST_INTERVAL", "3"))  # seconds per request
+MAX_CONNECTIONS = int(os.getenv("ARXIV_MAX_CONNECTIONS", "1"))
+CACHE_DIR = os.getenv("ARXIV_CACHE_DIR", os.path.join(os.path.dirname(__file__), "data", "http_cache"))
+CACHE_TTL = float(os.getenv("ARXIV_CACHE_TTL", str(6 * 3600)))  # seconds; 0 = always revalidate
+CACHE_KEEP = 3 * 24 * 3600  # prune_cache() drops entries older than this
+FETCH_TIMEOUT = 60
+FETCH_RETRIES = 3
+USER_AGENT = "arxivbutler/1.0 (+https://arxivbutler.com/)"
+
+class TokenBucket:
+    """Thread-safe token bucket; `acquire` blocks until a token is available.
+
+    Tokens may go negative: each caller reserves the next free slot under the
+    lock and sleeps outside it, so waiters are served in arrival order.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+    def defer(self, seconds):
+        """Hand out no token for the next `seconds`, to whichever thread asks."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens = min(self._tokens, 1 - seconds * self.rate)
+
+LIMITER = TokenBucket(1 / REQUEST_INTERVAL if REQUEST_INTERVAL > 0 else 1e9)
+_CONNECTIONS = threading.BoundedSemaphore(MAX_CONNECTIONS)
+
+# One keep-alive pool shared by every category, page and thread
+SESSION = requests.Session()
+SESSION.headers["User-Agent"] = USER_AGENT
+_adapter = HTTPAdapter(pool_maxsize=MAX_CONNECTIONS)
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+
+# --- RESPONSE CACHE ---
+# <sha256(url)>.body holds the response body, <sha256(url)>.json the url, validators
+# and fetch time. Both are written to a temp file and renamed into place, and the
+# body only once it has been read in full, so an interrupted download never leaves
+# a truncated page behind.
+def _cache_paths(url):
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    base = os.path.join(CACHE_DIR, key)
+    return base + ".body", base + ".json"
+
+def _cache_meta(url):
+    body_path, meta_path = _cache_paths(url)
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("url") != url or not os.path.exists(body_path):
+        return None
+    return meta
+
+def _write_meta(url, meta):
+    fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp, _cache_paths(url)[1])
+
+def _read_cached(url, chunk_size):
+    with open(_cache_paths(url)[0], "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+def _read_and_store(url, response, chunk_size):
+    """Yield the response body while copying it into the cache."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in response.iter_content(chunk_size):
+                f.write(chunk)
+                yield chunk
+    except BaseException:  # includes GeneratorExit when the caller stops early
+        os.remove(tmp)
+        raise
+    os.replace(tmp, _cache_paths(url)[0])
+    _write_meta(url, {
+        "url": url,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "fetched_at": time.time(),
+    })
+
+def prune_cache(max_age=CACHE_KEEP):
+    """Delete cached responses not refreshed within `max_age` seconds. Returns how many."""
+    if not os.path.isdir(CACHE_DIR):
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for name in os.listdir(CACHE_DIR):
+        path = os.path.join(CACHE_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += name.endswith(".body")
+        except OSError:
+            pass
+    return removed
+
+# --- FETCH ---
+def _before_retry(error, attempt, url, limiter):
+    print(f"⚠️  Fetch failed ({error}), retry {attempt}/{FETCH_RETRIES - 1}: {url}")
+    # arXiv (OAI-PMH in particular) answers 503 + Retry-After when it wants a pause;
+    # the pause goes on the shared limiter so it holds back every thread, not just this one
+    response = getattr(error, "response", None)
+    if response is not None and response.status_code == 503:
+        retry_after = response.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            limiter.defer(min(int(retry_after), 600))
+
+def fetch(url, limiter=LIMITER, ttl=CACHE_TTL):
+    """GET `url` politely and return the body as bytes. Retries transient failures."""
+    return b"".join(fetch_stream(url, limiter, ttl=ttl))
+
+def fetch_stream(url, limiter=LIMITER, chunk_size=64 * 1024, ttl=CACHE_TTL):
+    """
+    GET `url` politely and yield the body in chunks as they arrive, so the caller
+    can parse while the rest downloads. A cached copy younger than `ttl` seconds is
+    served without a request; with ttl=None the cache is neither read nor written.
+    The connection slot is held until the body is consumed or the generator is
+    closed. Only connecting is retried.
+    """
+    meta = _cache_meta(url) if ttl is not None else None
+    if meta and time.time() - meta["fetched_at"] < ttl:
+        yield from _read_cached(url, chunk_size)
+        return
+
+    headers = {}
+    if meta and meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta and meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+
+    for attempt in range(1, FETCH_RETRIES + 1):
+        _CONNECTIONS.acquire()
+        limiter.acquire()
+        try:
+            response = SESSION.get(url, headers=headers, stream=True, timeout=FETCH_TIMEOUT)
+            response.raise_for_status()
+            break
+        except OSError as e:  # every requests exception is an IOError
+            _CONNECTIONS.release()
+            if attempt == FETCH_RETRIES:
+                raise
+            _before_retry(e, attempt, url, limiter)
+
+    try:
+        with response:
+            if ttl is None:
+                yield from response.iter_content(chunk_size)
+                return
+            if response.status_code != 304:
+                yield from _read_and_store(url, response, chunk_size)
+                return
+    finally:
+        _CONNECTIONS.release()
+
+    # Not modified: restart the TTL and serve the stored body
+    meta["fetched_at"] = time.time()
+    _write_meta(url, meta)
+    yield from _read_cached(url, chunk_size)
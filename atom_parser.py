@@ -0,0 +1,72 @@
+"""
+Incremental parser for arXiv API (Atom) responses.
+
+Feeds response bytes to an XMLPullParser as they arrive and yields one compact
+paper record per <entry> as soon as it is complete, dropping the element right
+away, so memory per page stays flat and parsing overlaps with the download.
+Records have the same shape as the manuscripts rows the harvesters insert.
+"""
+import json
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+
+ATOM = "{http://www.w3.org/2005/Atom}"
+ENTRY = ATOM + "entry"
+ERROR_ID_PREFIX = "http://arxiv.org/api/errors"
+
+def _text(elem, tag):
+    return (elem.findtext(tag) or "").strip().replace('\n', ' ')
+
+def entry_to_paper(entry):
+    """Map one <entry> element onto (published datetime, manuscripts row dict)."""
+    entry_id = _text(entry, ATOM + "id")
+    if entry_id.startswith(ERROR_ID_PREFIX):
+        raise ValueError(f"arXiv API error: {_text(entry, ATOM + 'summary')}")
+
+    published_dt = datetime.fromisoformat(_text(entry, ATOM + "published"))
+    if published_dt.tzinfo is None:
+        published_dt = published_dt.replace(tzinfo=timezone.utc)
+
+    link = ""
+    for link_elem in entry.iterfind(ATOM + "link"):
+        if link_elem.get("rel", "alternate") == "alternate":
+            link = link_elem.get("href", "")
+            break
+
+    return published_dt, {
+        "id": entry_id.split('/')[-1],
+        "title": _text(entry, ATOM + "title"),
+        "authors": json.dumps([_text(a, ATOM + "name") for a in entry.iterfind(ATOM + "author")]),
+        "orcids": json.dumps([]),
+        "keywords": json.dumps([c.get("term") for c in entry.iterfind(ATOM + "category") if c.get("term")]),
+        "abstract": _text(entry, ATOM + "summary"),
+        "link": link,
+        "published_timestamp": published_dt.isoformat(),
+        "added_timestamp": datetime.now(timezone.utc).isoformat()
+    }
+
+def iter_papers(chunks):
+    """Yield (published datetime, paper dict) for each entry in a stream of byte chunks."""
+    parser = ET.XMLPullParser(events=("start", "end"))
+    root = None
+
+    def drain():
+        nonlocal root
+        for event, elem in parser.read_events():
+            if event == "start":
+                if root is None:
+                    root = elem
+            elif elem.tag == ENTRY:
+                yield entry_to_paper(elem)
+                # Entries are complete by now; drop them from the tree
+                root.clear()
+
+    for chunk in chunks:
+        parser.feed(chunk)
+        yield from drain()
+    parser.close()
+    yield from drain()
+
+def parse_papers(data):
+    """Parse a whole response body at once."""
+    return list(iter_papers([data]))
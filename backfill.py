@@ -1,172 +1,143 @@
-import os
-import sqlite3
-import json
-import feedparser
-from datetime import datetime, timedelta
-from time import mktime, sleep
+import sys
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timedelta, timezone
 from urllib.parse import quote_plus
-print('❌ Do not use, does not work! ❌')
+
+import ingest
+from arxiv_client import ARXIV_API_URL, fetch_stream
+from atom_parser import iter_papers
+from daily_update import DB_PATH, SEARCH_QUERIES, initialize_database
 
 # --- CONFIG ---
-DB_PATH = os.path.join(os.path.dirname(__file__), "data", "manuscript_db.db")
-CHECKPOINT_PATH = os.path.join(os.path.dirname(__file__), "data", "backfill_checkpoints.json")
-ARXIV_API_URL = "http://export.arxiv.org/api/query"
-BATCH_SIZE = 200
-SEGMENT_LENGTH_DAYS = 8
-
-# --- CATEGORIES ---
-SEARCH_CATEGORIES = [
-    "astro-ph", "cond-mat.dis-nn", "cond-mat.mes-hall", "cond-mat.mtrl-sci", "cond-mat.other",
-    "cond-mat.quant-gas", "cond-mat.soft", "cond-mat.stat-mech", "cond-mat.str-el", "cond-mat.supr-con",
-    "gr-qc", "hep-ex", "hep-lat", "hep-ph", "hep-th", "math-ph", "nlin.AO", "nlin.CD", "nlin.CG",
-    "nlin.PS", "nlin.SI", "nucl-ex", "nucl-th", "physics.acc-ph", "physics.ao-ph", "physics.app-ph",
-    "physics.atm-clus", "physics.atom-ph", "physics.bio-ph", "physics.chem-ph", "physics.class-ph",
-    "physics.comp-ph", "physics.data-an", "physics.ed-ph", "physics.flu-dyn", "physics.gen-ph",
-    "physics.geo-ph", "physics.hist-ph", "physics.ins-det", "physics.med-ph", "physics.optics",
-    "physics.plasm-ph", "physics.pop-ph", "physics.soc-ph", "physics.space-ph", "quant-ph",
-    "math.AC", "math.AG", "math.AP", "math.AT", "math.CA", "math.CO", "math.CT", "math.CV",
-    "math.DG", "math.DS", "math.FA", "math.GM", "math.GN", "math.GR", "math.GT", "math.HO",
-    "math.IT", "math.KT", "math.LO", "math.MG", "math.MP", "math.NA", "math.NT", "math.OA",
-    "math.OC", "math.PR", "math.QA", "math.RA", "math.RT", "math.SG", "math.SP", "math.ST",
-    "cs.AI", "cs.AR", "cs.CC", "cs.CE", "cs.CG", "cs.CL", "cs.CR", "cs.CV", "cs.CY", "cs.DB",
-    "cs.DC", "cs.DL", "cs.DM", "cs.DS", "cs.ET", "cs.FL", "cs.GL", "cs.GR", "cs.GT", "cs.HC",
-    "cs.IR", "cs.IT", "cs.LG", "cs.LO", "cs.MA", "cs.MM", "cs.MS", "cs.NA", "cs.NE", "cs.NI",
-    "cs.OH", "cs.OS", "cs.PF", "cs.PL", "cs.RO", "cs.SC", "cs.SD", "cs.SE", "cs.SI", "cs.SY",
-    "stat.AP", "stat.CO", "stat.ME", "stat.ML", "stat.OT", "stat.TH",
-    "q-bio.BM", "q-bio.CB", "q-bio.GN", "q-bio.MN", "q-bio.NC", "q-bio.OT", "q-bio.PE",
-    "q-bio.QM", "q-bio.SC", "q-bio.TO",
-    "q-fin.CP", "q-fin.EC", "q-fin.GN", "q-fin.MF", "q-fin.PM", "q-fin.PR", "q-fin.RM", "q-fin.ST", "q-fin.TR",
-    "eess.AS", "eess.IV", "eess.SP", "eess.SY",
-    "econ.EM", "econ.GN", "econ.TH"
-]
-
-# --- CHECKPOINT UTILS ---
-def load_checkpoints():
-    if os.path.exists(CHECKPOINT_PATH):
-        with open(CHECKPOINT_PATH, "r") as f:
-            return json.load(f)
-    return {}
-
-def save_checkpoints(data):
-    with open(CHECKPOINT_PATH, "w") as f:
-        json.dump(data, f, indent=2)
-
-def is_segment_done(checkpoints, category, seg_str):
-    return category in checkpoints and seg_str in checkpoints[category]
-
-def mark_segment_done(checkpoints, category, seg_str):
-    checkpoints.setdefault(category, []).append(seg_str)
-    save_checkpoints(checkpoints)
+BATCH_SIZE = 1000
+SEGMENT_LENGTH_DAYS = 7
+WORKERS = 4  # segments in flight; request pacing is up to arxiv_client
+
+# --- CHECKPOINTS ---
+# One row per finished (category, segment). It is written in the same transaction
+# as the segment's papers, so after a crash a segment is either fully stored and
+# skipped, or not recorded and fetched again.
+CREATE_CHECKPOINT_SQL = """
+CREATE TABLE IF NOT EXISTS backfill_segments (
+    category TEXT NOT NULL,
+    seg_start TEXT NOT NULL,
+    seg_end TEXT NOT NULL,
+    fetched INTEGER NOT NULL,
+    inserted INTEGER NOT NULL,
+    finished_at TEXT NOT NULL,
+    PRIMARY KEY (category, seg_start, seg_end)
+);
+"""
+
+def load_done_segments(conn):
+    conn.execute(CREATE_CHECKPOINT_SQL)
+    return {tuple(row) for row in conn.execute("SELECT category, seg_start, seg_end FROM backfill_segments")}
+
+def store_segment(conn, category, seg_start, seg_end, papers):
+    """Insert a segment's papers and record it as done, atomically."""
+    with conn:
+        inserted = ingest.insert_papers(conn, papers)
+        conn.execute("""
+            INSERT OR REPLACE INTO backfill_segments
+                (category, seg_start, seg_end, fetched, inserted, finished_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (category, seg_start, seg_end, len(papers), inserted, datetime.now(timezone.utc).isoformat()))
+    return inserted
 
 # --- DATE UTILS ---
-def daterange(start_date, end_date, delta=timedelta(days=7)):
+def segments(start_date, end_date, days=SEGMENT_LENGTH_DAYS):
+    """Split [start_date, end_date) into consecutive, non-overlapping day ranges."""
     current = start_date
     while current < end_date:
-        yield current, min(current + timedelta(days=SEGMENT_LENGTH_DAYS), end_date)
-        current += delta
+        seg_end = min(current + timedelta(days=days), end_date)
+        yield current, seg_end
+        current = seg_end
 
 def format_arxiv_date(dt):
-    return dt.strftime("%Y%m%d")
+    return dt.strftime("%Y%m%d%H%M")
 
 # --- FETCH ---
-def fetch_arxiv_segment(category, start_date, end_date):
+def fetch_arxiv_segment(category, start_date, end_date, batch_size=BATCH_SIZE):
     all_papers = []
     start = 0
-    date_filter = f"[{format_arxiv_date(start_date)}0000 TO {format_arxiv_date(end_date)}2359]"
+    # submittedDate ranges are inclusive; stop one minute short of the next segment
+    date_filter = f"[{format_arxiv_date(start_date)} TO {format_arxiv_date(end_date - timedelta(minutes=1))}]"
     query = quote_plus(f"cat:{category} AND submittedDate:{date_filter}")
 
     while True:
         url = (
             f"{ARXIV_API_URL}?search_query={query}"
-            f"&start={start}&max_results={BATCH_SIZE}"
+            f"&start={start}&max_results={batch_size}"
             f"&sortBy=submittedDate&sortOrder=ascending"
         )
-        print(f"Fetching {category} from {start_date.date()} to {end_date.date()} ({start}–{start + BATCH_SIZE - 1})")
-        feed = feedparser.parse(url)
+        # Each segment page is fetched once, so it is not worth a cache entry
+        page = [paper for _, paper in iter_papers(fetch_stream(url, ttl=None))]
+        all_papers.extend(page)
 
-        if not feed.entries:
+        # A short page is the last one; no need to ask for an empty page after it
+        if len(page) < batch_size:
             break
-
-        for entry in feed.entries:
-            published = datetime.fromtimestamp(mktime(entry.published_parsed))
-            arxiv_id = entry.id.split('/')[-1]
-            title = entry.title.strip().replace('\n', ' ')
-            abstract = entry.summary.strip().replace('\n', ' ')
-            authors = [a.name for a in entry.authors]
-            keywords = [t["term"] for t in entry.tags] if "tags" in entry else []
-            link = entry.link
-
-            all_papers.append({
-                "id": arxiv_id,
-                "title": title,
-                "authors": json.dumps(authors),
-                "orcids": json.dumps([]),
-                "keywords": json.dumps(keywords),
-                "abstract": abstract,
-                "link": link,
-                "published_timestamp": published.isoformat(),
-                "added_timestamp": datetime.utcnow().isoformat()
-            })
-
-        start += BATCH_SIZE
-        sleep(1)
+        start += batch_size
 
     return all_papers
 
-# --- DB INSERT ---
-def insert_papers(papers):
-    if not papers:
-        return 0
-
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        new_count = 0
-        for paper in papers:
-            try:
-                cursor.execute("""
-                    INSERT INTO manuscripts (
-                        id, title, authors, orcids, keywords, abstract,
-                        link, published_timestamp, added_timestamp
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    paper["id"], paper["title"], paper["authors"], paper["orcids"],
-                    paper["keywords"], paper["abstract"], paper["link"],
-                    paper["published_timestamp"], paper["added_timestamp"]
-                ))
-                cursor.execute("""
-                    INSERT INTO fts_manuscripts (
-                        rowid, title, abstract, keywords, authors
-                    ) VALUES (?, ?, ?, ?, ?)
-                """, (
-                    paper["id"], paper["title"], paper["abstract"],
-                    paper["keywords"], paper["authors"]
-                ))
-                new_count += 1
-            except sqlite3.IntegrityError:
-                continue
-        conn.commit()
-    return new_count
-
 # --- MAIN ---
-def backfill(start_date_str, end_date_str):
-    start_date = datetime.strptime(start_date_str, "%Y-%m-%d")
-    end_date = datetime.strptime(end_date_str, "%Y-%m-%d")
-    checkpoints = load_checkpoints()
-    total_added = 0
-
-    for seg_start, seg_end in daterange(start_date, end_date):
-        seg_str = f"{seg_start.date()}_{seg_end.date()}"
-        for category in SEARCH_CATEGORIES:
-            if is_segment_done(checkpoints, category, seg_str):
-                continue
-
-            papers = fetch_arxiv_segment(category, seg_start, seg_end)
-            added = insert_papers(papers)
-            print(f"→ {added} new entries added.")
-            total_added += added
-            mark_segment_done(checkpoints, category, seg_str)
+def backfill(start_date_str, end_date_str, categories=SEARCH_QUERIES, workers=WORKERS):
+    start_date = datetime.strptime(start_date_str, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    end_date = datetime.strptime(end_date_str, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    initialize_database()
+
+    conn = ingest.connect(DB_PATH)
+    done = load_done_segments(conn)
+    tasks = [
+        (category, seg_start, seg_end)
+        for seg_start, seg_end in segments(start_date, end_date)
+        for category in categories
+        if (category, seg_start.date().isoformat(), seg_end.date().isoformat()) not in done
+    ]
+    print(f"Backfill {start_date_str} → {end_date_str}: {len(tasks)} segment(s) to fetch, {len(done)} already done.")
 
+    total_added = 0
+    finished = 0
+    started = datetime.now(timezone.utc)
+    pending = {}
+    queue = iter(tasks)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Keep a bounded number of segments in flight so memory stays flat
+        while True:
+            while len(pending) < workers * 2:
+                task = next(queue, None)
+                if task is None:
+                    break
+                pending[pool.submit(fetch_arxiv_segment, *task)] = task
+            if not pending:
+                break
+
+            completed, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in completed:
+                category, seg_start, seg_end = pending.pop(future)
+                label = f"{category} {seg_start.date()}–{seg_end.date()}"
+                try:
+                    papers = future.result()
+                except Exception as e:
+                    # Not checkpointed, so the next run retries it
+                    print(f"❌ {label}: {e}")
+                    continue
+                added = store_segment(conn, category, seg_start.date().isoformat(),
+                                      seg_end.date().isoformat(), papers)
+                total_added += added
+                finished += 1
+                rate = finished / max((datetime.now(timezone.utc) - started).total_seconds(), 1e-9)
+                print(f"→ {label}: {len(papers)} fetched, {added} new ({finished}/{len(tasks)}, {rate * 60:.1f} segments/min)")
+
+    conn.close()
     print(f"\n✅ Backfill completed. Total new entries: {total_added}")
+    return total_added
 
 if __name__ == "__main__":
-    backfill("2024-08-01", "2025-08-01")
+    print('')
+    print(datetime.now(timezone.utc).isoformat())
+    if len(sys.argv) != 3:
+        print("Usage: python backfill.py START_DATE END_DATE   (YYYY-MM-DD, end exclusive)")
+        sys.exit(1)
+    backfill(sys.argv[1], sys.argv[2])
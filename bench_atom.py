@@ -0,0 +1,86 @@
+"""
+Microbenchmark: atom_parser.iter_papers vs feedparser on arXiv API responses.
+
+Pass recorded responses (e.g. saved with `curl -o page.xml '<api query>'`); without
+arguments a synthetic 1000-entry page is used. Reports wall time and peak Python
+memory (tracemalloc) per page for each parser.
+
+    python bench_atom.py [feed.xml ...]
+"""
+import sys
+import time
+import tracemalloc
+
+from atom_parser import iter_papers
+
+ENTRIES = 1000
+REPEAT = 5
+
+def synthetic_feed(n=ENTRIES):
+    entry = """
+  <entry>
+    <id>http://arxiv.org/abs/2510.{i:05d}v1</id>
+    <updated>2025-10-16T17:59:59Z</updated>
+    <published>2025-10-16T17:59:59Z</published>
+    <title>A synthetic title about topological photonic
+  crystals number {i}</title>
+    <summary>  {abstract}
+</summary>
+    <author><name>First Author</name><arxiv:affiliation>Somewhere</arxiv:affiliation></author>
+    <author><name>Second Author</name></author>
+    <author><name>Third Author</name></author>
+    <arxiv:comment>12 pages, 5 figures</arxiv:comment>
+    <link href="http://arxiv.org/abs/2510.{i:05d}v1" rel="alternate" type="text/html"/>
+    <link title="pdf" href="http://arxiv.org/pdf/2510.{i:05d}v1" rel="related" type="application/pdf"/>
+    <arxiv:primary_category term="physics.optics" scheme="http://arxiv.org/schemas/atom"/>
+    <category term="physics.optics" scheme="http://arxiv.org/schemas/atom"/>
+    <category term="cond-mat.mes-hall" scheme="http://arxiv.org/schemas/atom"/>
+  </entry>"""
+    abstract = ("We present a comprehensive and automated framework for the design of "
+                "symmetry-protected interface modes in two-dimensional photonic crystals. ") * 8
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<feed xmlns="http://www.w3.org/2005/Atom" xmlns:arxiv="http://arxiv.org/schemas/atom"\n'
+        '      xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/">\n'
+        '  <title type="html">ArXiv Query</title>\n'
+        f'  <opensearch:totalResults>{n}</opensearch:totalResults>'
+        + "".join(entry.format(i=i, abstract=abstract) for i in range(n))
+        + "\n</feed>\n"
+    ).encode()
+
+def chunked(data, size=64 * 1024):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+def measure(label, fn):
+    best = float("inf")
+    for _ in range(REPEAT):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    tracemalloc.start()
+    count = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"[timing] {label:<12} entries={count:>5}  best={best * 1000:8.1f} ms  peak={peak / 2**20:7.1f} MiB")
+
+def main():
+    pages = [(path, open(path, "rb").read()) for path in sys.argv[1:]]
+    if not pages:
+        pages = [(f"synthetic ({ENTRIES} entries)", synthetic_feed())]
+
+    try:
+        import feedparser
+    except ImportError:
+        feedparser = None
+        print("[note] feedparser not installed; timing atom_parser only")
+
+    for name, data in pages:
+        print(f"\n--- {name}: {len(data) / 2**20:.1f} MiB")
+        # Streaming consumer: keep nothing but a count, as the harvesters do per paper
+        measure("atom_parser", lambda: sum(1 for _ in iter_papers(chunked(data))))
+        if feedparser:
+            measure("feedparser", lambda: len(feedparser.parse(data).entries))
+
+if __name__ == "__main__":
+    main()
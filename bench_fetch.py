@@ -0,0 +1,76 @@
+"""
+Politeness check for arxiv_client: request start times under contention.
+
+A local HTTP server records when each request arrives.
+- [spacing] Its first response is slow, so the other clients queue behind the
+  single connection slot. Every request must still start at least INTERVAL
+  after the one before it.
+- [retry-after] Its first response is a 503 with Retry-After: RETRY_AFTER. No
+  client, including the ones that never saw the 503, may start a request
+  before the pause is over.
+
+    python bench_fetch.py
+"""
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import arxiv_client
+
+INTERVAL = 0.5        # seconds between request starts
+SLOW = 4 * INTERVAL   # the first response takes this long
+CLIENTS = 4
+RETRY_AFTER = 2       # seconds, as the server asks after a 503
+TOLERANCE = 0.02      # timer and scheduling slack
+
+starts = []
+mode = "slow"
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        starts.append(time.monotonic())
+        if len(starts) == 1 and mode == "503":
+            self.send_response(503)
+            self.send_header("Retry-After", str(RETRY_AFTER))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if len(starts) == 1:
+            time.sleep(SLOW)
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+def run(base, limiter):
+    threads = [threading.Thread(target=arxiv_client.fetch, args=(f"{base}/{i}", limiter), kwargs={"ttl": None})
+               for i in range(CLIENTS)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)  # let the first request take the slot before the others queue
+    for thread in threads:
+        thread.join()
+
+if __name__ == "__main__":
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    run(base, arxiv_client.TokenBucket(1 / INTERVAL))
+    offsets = [round(t - starts[0], 2) for t in starts]
+    gaps = [b - a for a, b in zip(starts, starts[1:])]
+    print(f"[spacing] interval {INTERVAL}s, first response {SLOW}s, start offsets {offsets}")
+    assert min(gaps) >= INTERVAL - TOLERANCE, f"requests {min(gaps):.2f}s apart"
+    print("✅ Queued requests never started closer together than the interval.")
+
+    starts.clear()
+    mode = "503"
+    run(base, arxiv_client.TokenBucket(1 / INTERVAL))
+    offsets = [round(t - starts[0], 2) for t in starts]
+    print(f"[retry-after] Retry-After {RETRY_AFTER}s, start offsets {offsets}")
+    assert starts[1] - starts[0] >= RETRY_AFTER - TOLERANCE, "a request started during the pause"
+    print("✅ No request started before Retry-After had passed.")
+    server.shutdown()
@@ -0,0 +1,173 @@
+"""
+Regression benchmark for filtering.py on a synthetic corpus.
+
+Builds a throw-away manuscript DB (schema as in daily_update.py) and times the old
+matcher (FTS titles, then `WHERE title IN (...)`, then a Python timestamp filter)
+against the rowid join and the single-pass sweep used by filtering.py now.
+
+    python bench_filtering.py [rows] [db path]
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+from filtering import fts_matches, sweep_matches, build_fts_query_from_filter
+from matching import PhraseIndex
+
+N_ROWS = 500000
+NEW_ROWS = 5000            # "today's" papers at the end of the corpus
+MAX_VARIABLES = 32766      # SQLITE_MAX_VARIABLE_NUMBER since 3.32
+
+random.seed(42)
+VOCAB = [f"w{i}" for i in range(5000)] + ["quantum", "photonic", "crystal", "graphene", "topological"]
+
+FILTERS = {
+    "narrow": {"keyword_groups": [['"photonic"'], ['"topological"']]},
+    "broad": {"keyword_groups": [['"quantum"', '"graphene"']]},
+}
+
+def _text(n):
+    return " ".join(random.choice(VOCAB) for _ in range(n))
+
+def build_corpus(path, n_rows):
+    with sqlite3.connect(path) as conn:
+        conn.execute("""
+            CREATE TABLE manuscripts (
+                pk INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT NOT NULL UNIQUE, title TEXT NOT NULL,
+                authors TEXT NOT NULL, orcids TEXT, keywords TEXT, abstract TEXT,
+                link TEXT NOT NULL, published_timestamp TEXT NOT NULL,
+                added_timestamp TEXT NOT NULL, summary TEXT DEFAULT ''
+            )
+        """)
+        conn.execute("""
+            CREATE VIRTUAL TABLE manuscripts_fts USING fts5(
+                title, abstract, authors, keywords, content='manuscripts', content_rowid='pk'
+            )
+        """)
+        start = datetime.now(timezone.utc) - timedelta(days=730)
+        step = timedelta(days=730) / n_rows
+        rows = (
+            (f"{i:07d}", _text(10), '["A. Author"]', "[]", '["physics.optics"]', _text(120),
+             f"http://arxiv.org/abs/{i:07d}", (start + i * step).isoformat(), (start + i * step).isoformat())
+            for i in range(n_rows)
+        )
+        conn.executemany("""
+            INSERT INTO manuscripts (id, title, authors, orcids, keywords, abstract,
+                                     link, published_timestamp, added_timestamp)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        conn.execute("INSERT INTO manuscripts_fts(manuscripts_fts) VALUES('rebuild')")
+        conn.commit()
+
+def legacy_match(cur, fts_query, last_scan_dt):
+    cur.execute("SELECT title FROM manuscripts_fts WHERE manuscripts_fts MATCH ?", (fts_query,))
+    titles = [row[0] for row in cur.fetchall()]
+    rows = []
+    # One query per chunk; a single IN list this long fails outright
+    for i in range(0, len(titles), MAX_VARIABLES):
+        chunk = titles[i:i + MAX_VARIABLES]
+        cur.execute(f"SELECT * FROM manuscripts WHERE title IN ({','.join('?' for _ in chunk)})", chunk)
+        rows.extend(cur.fetchall())
+    return [r for r in rows if datetime.fromisoformat(r["added_timestamp"]) > last_scan_dt]
+
+# (keyword, text) pairs where a naive Unicode normalization disagrees with unicode61
+PARITY_CASES = [
+    ("h2o", "Splitting H₂O on oxides"), ("finite", "A ﬁnite lattice"), ("x2", "Terms in x²"),
+    ("ff", "The ﬀ ligature"), ("schrodinger", "Schrödinger cats"), ("uber", "ÜBER alles"),
+    ("naive", "A naïve bound"), ("cafe", "Café physics"), ("ss", "Straße"), ("i", "İstanbul"),
+    ("nguyen", "Nguyễn et al."), ("nguyễn", "NGUYỄN et al."), ("σοφιας", "σοφιασ"),
+    ("thoi", "Thời gian"), ("ab", "á̂b decomposed"),
+]
+
+# Letters for the differential test: Latin with zero, one and two diacritics,
+# precomposed and decomposed, Greek with final sigma, Cyrillic, ligatures and
+# sub/superscripts, plus a few separators
+DIFF_CHARS = ("aeiouny" "AEIOUNY" "áéíóúñýÁÉÍÓÚÑÝ" "ễờǖǘǟỹẤ" "ơưđøłß" "\u0301\u0302\u0303"
+              "αβγσςΣάὰᾶ" "ёйӧЁЙ" "ﬁﬀĳ" "²₂½" "-_.")
+DIFF_CASES = 400
+
+def differential_cases(n=DIFF_CASES, seed=7):
+    """(keyword, text) pairs where the keyword is a case/diacritic variant of a word in the text."""
+    rnd = random.Random(seed)
+    cases = []
+    for _ in range(n):
+        words = ["".join(rnd.choices(DIFF_CHARS, k=rnd.randint(2, 6))) for _ in range(4)]
+        word = rnd.choice(words)
+        variant = "".join(rnd.choice((ch, ch.lower(), ch.upper(), rnd.choice(DIFF_CHARS))) if rnd.random() < 0.3 else ch
+                          for ch in word)
+        cases.append((variant, " ".join(words)))
+    return cases
+
+def tokenizer_parity(cases=PARITY_CASES):
+    """Check PhraseIndex against FTS5 MATCH on (keyword, text) cases. Returns the mismatches."""
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE VIRTUAL TABLE t USING fts5(title)")
+    conn.executemany("INSERT INTO t (rowid, title) VALUES (?, ?)", enumerate((text for _, text in cases), 1))
+    mismatches = []
+    for rowid, (keyword, text) in enumerate(cases, 1):
+        if '"' in keyword:
+            continue
+        fts = conn.execute("SELECT 1 FROM t WHERE t MATCH ? AND rowid = ?", (f'"{keyword}"', rowid)).fetchone() is not None
+        index = PhraseIndex()
+        index.add_filter(0, [[f'"{keyword}"']])
+        sweep = bool(index.match([text]))
+        if fts != sweep:
+            mismatches.append((keyword, text, fts, sweep))
+    conn.close()
+    return mismatches
+
+def timed(label, fn):
+    t = time.time()
+    result = fn()
+    print(f"[timing] {label:<40} {time.time() - t:8.3f}s  results={len(result)}")
+    return result
+
+def main():
+    mismatches = tokenizer_parity()
+    for keyword, text, fts, sweep in mismatches:
+        print(f"[parity] {keyword!r} in {text!r}: MATCH={fts} sweep={sweep}")
+    print(f"[parity] {len(PARITY_CASES) - len(mismatches)}/{len(PARITY_CASES)} tokenizer cases agree with FTS5")
+    mismatches = tokenizer_parity(differential_cases())
+    for keyword, text, fts, sweep in mismatches[:10]:
+        print(f"[differential] {keyword!r} in {text!r}: MATCH={fts} sweep={sweep}")
+    print(f"[differential] {DIFF_CASES - len(mismatches)}/{DIFF_CASES} random non-ASCII cases agree with FTS5")
+
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else N_ROWS
+    path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(tempfile.gettempdir(), f"bench_filtering_{n_rows}.db")
+    if not os.path.exists(path):
+        t = time.time()
+        build_corpus(path, n_rows)
+        print(f"[setup] built {n_rows} rows in {time.time() - t:.1f}s → {path}")
+
+    with sqlite3.connect(path) as conn:
+        conn.row_factory = sqlite3.Row
+        cur = conn.cursor()
+        cur.execute("SELECT MAX(pk) FROM manuscripts")
+        high = cur.fetchone()[0]
+        low = max(high - NEW_ROWS, 0)
+        cur.execute("SELECT added_timestamp FROM manuscripts WHERE pk = ?", (low,))
+        last_scan_dt = datetime.fromisoformat(cur.fetchone()[0]) if low else datetime.min.replace(tzinfo=timezone.utc)
+
+        for name, flt in FILTERS.items():
+            query = build_fts_query_from_filter(flt)
+            print(f"\n--- {name}: {query}")
+            old = timed("legacy FTS + title IN + Python cut", lambda: legacy_match(cur, query, last_scan_dt))
+            new = timed("rowid join, new rows only", lambda: fts_matches(cur, query, low, high))
+            timed("rowid join, whole corpus", lambda: fts_matches(cur, query, 0, high))
+            if len(old) != len(new):
+                print(f"[note] legacy returned {len(old)} rows vs {len(new)} (duplicate titles)")
+
+        index = PhraseIndex()
+        for key, flt in enumerate(FILTERS.values()):
+            index.add_filter(key, flt["keyword_groups"])
+        watermarks = {key: low for key in range(len(FILTERS))}
+        print("\n--- all filters")
+        hits = timed("single-pass sweep, new rows only", lambda: sweep_matches(cur, index, watermarks, low, high))
+        print("[hits] " + ", ".join(f"{name}={len(hits.get(key, []))}" for key, name in enumerate(FILTERS)))
+
+if __name__ == "__main__":
+    main()
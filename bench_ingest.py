@@ -0,0 +1,104 @@
+"""
+Ingest throughput benchmark: legacy per-paper inserts vs ingest.insert_papers.
+
+Each run starts from an empty DB with the daily_update.py schema and loads N
+synthetic papers (10% of them repeated, like cross-listings) in 500-paper
+batches, one transaction each, the way the harvesters call it.
+
+    python bench_ingest.py [N ...]
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import tempfile
+
+import ingest
+
+SIZES = [10000, 100000, 1000000]
+LEGACY_MAX = 100000        # the per-row path is too slow to be worth timing beyond this
+CHUNK = 500
+
+SCHEMA = [
+    """CREATE TABLE manuscripts (
+        pk INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT NOT NULL UNIQUE, title TEXT NOT NULL,
+        authors TEXT NOT NULL, authors_display TEXT, orcids TEXT, keywords TEXT, abstract TEXT,
+        link TEXT NOT NULL, published_timestamp TEXT NOT NULL,
+        added_timestamp TEXT NOT NULL, summary TEXT DEFAULT '')""",
+    """CREATE VIRTUAL TABLE manuscripts_fts USING fts5(
+        title, abstract, authors, keywords, content='manuscripts', content_rowid='pk')""",
+]
+
+VOCAB = [f"w{i}" for i in range(20000)]
+
+def batches(n):
+    """Yield the same pseudo-random papers for every run, CHUNK at a time."""
+    rng = random.Random(7)
+    papers = []
+    for i in range(n):
+        j = rng.randrange(i) if i and rng.random() < 0.1 else i
+        papers.append({
+            "id": f"{j:08d}v1",
+            "title": " ".join(rng.choices(VOCAB, k=10)),
+            "authors": json.dumps(["A. Author", "B. Author"]),
+            "orcids": "[]",
+            "keywords": json.dumps(["quant-ph"]),
+            "abstract": " ".join(rng.choices(VOCAB, k=150)),
+            "link": f"http://arxiv.org/abs/{j:08d}v1",
+            "published_timestamp": "2025-01-01T00:00:00+00:00",
+            "added_timestamp": "2025-01-02T00:00:00+00:00",
+        })
+        if len(papers) == CHUNK:
+            yield papers
+            papers = []
+    if papers:
+        yield papers
+
+def legacy_insert(conn, papers):
+    cursor = conn.cursor()
+    new_count = 0
+    for paper in papers:
+        try:
+            cursor.execute("""
+                INSERT INTO manuscripts (id, title, authors, orcids, keywords, abstract,
+                                         link, published_timestamp, added_timestamp)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (paper["id"], paper["title"], paper["authors"], paper["orcids"], paper["keywords"],
+                  paper["abstract"], paper["link"], paper["published_timestamp"], paper["added_timestamp"]))
+            cursor.execute("""
+                INSERT INTO manuscripts_fts (rowid, title, abstract, authors, keywords)
+                VALUES ((SELECT rowid FROM manuscripts WHERE id = ?), ?, ?, ?, ?)
+            """, (paper["id"], paper["title"], paper["abstract"], paper["authors"], paper["keywords"]))
+            new_count += 1
+        except sqlite3.IntegrityError:
+            continue
+    return new_count
+
+def run(label, connect, insert, n):
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    conn = connect(path)
+    for sql in SCHEMA:
+        conn.execute(sql)
+    conn.commit()
+    elapsed = 0.0
+    total = 0
+    for papers in batches(n):
+        t = time.time()
+        total += insert(conn, papers)
+        conn.commit()
+        elapsed += time.time() - t
+    conn.close()
+    os.remove(path)
+    print(f"[timing] {label:<8} n={n:>8}  new={total:>8}  {elapsed:8.2f}s  {n / elapsed:10.0f} rows/s")
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or SIZES
+    for n in sizes:
+        if n <= LEGACY_MAX:
+            run("legacy", sqlite3.connect, legacy_insert, n)
+        run("bulk", ingest.connect, ingest.insert_papers, n)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Storage and throughput: per-user matches.db copies vs the shared match table.
+
+Builds a synthetic corpus, gives every user MATCHES_PER_USER matches spread over
+FILTERS_PER_USER filters, and stores them both ways: a full row copy per match in
+data/users/user_<id>/matches.db (the old filtering.py path) and one
+(user, filter, pk) row per match in match_store's table. Reports bytes on disk,
+write time, and the time for a notifier-style read of every user's new matches.
+
+    python bench_matches.py [USERS] [MATCHES_PER_USER]
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import tempfile
+
+import ingest
+import match_store
+
+USERS = 500
+MATCHES_PER_USER = 200
+FILTERS_PER_USER = 3
+CORPUS = 20000
+
+SCHEMA = """
+CREATE TABLE manuscripts (
+    pk INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT NOT NULL UNIQUE, title TEXT NOT NULL,
+    authors TEXT NOT NULL, authors_display TEXT, orcids TEXT, keywords TEXT, abstract TEXT,
+    link TEXT NOT NULL, published_timestamp TEXT NOT NULL,
+    added_timestamp TEXT NOT NULL, summary TEXT DEFAULT '');
+"""
+
+USER_SCHEMA = """
+CREATE TABLE manuscripts (
+    id TEXT PRIMARY KEY, title TEXT NOT NULL, authors TEXT NOT NULL, orcids TEXT,
+    keywords TEXT, abstract TEXT, link TEXT NOT NULL, published_timestamp TEXT NOT NULL,
+    added_timestamp TEXT NOT NULL, label TEXT NOT NULL CHECK(label IN ('new', 'old')),
+    source_filter TEXT, summary TEXT);
+"""
+
+COLUMNS = "id, title, authors, orcids, keywords, abstract, link, published_timestamp, added_timestamp, summary"
+
+def build_corpus(path):
+    rng = random.Random(3)
+    words = [f"w{i}" for i in range(5000)]
+    with sqlite3.connect(path) as conn:
+        conn.executescript(SCHEMA)
+        conn.executemany(f"INSERT INTO manuscripts (pk, {COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+            (i, f"2510.{i:05d}v1", " ".join(rng.choices(words, k=10)),
+             json.dumps(["A. Author", "B. Author", "C. Author"]), "[]", json.dumps(["quant-ph"]),
+             " ".join(rng.choices(words, k=180)), f"http://arxiv.org/abs/2510.{i:05d}v1",
+             "2025-10-16T00:00:00+00:00", "2025-10-17T00:00:00+00:00", "novel thing, other thing")
+            for i in range(1, CORPUS + 1)))
+
+def user_matches(users, per_user):
+    rng = random.Random(5)
+    for u in range(users):
+        yield str(u), [(f"f{rng.randrange(FILTERS_PER_USER)}", pk)
+                       for pk in rng.sample(range(1, CORPUS + 1), per_user)]
+
+def size_of(*paths):
+    return sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+
+def bench_copies(root, corpus_path, users, per_user):
+    main = sqlite3.connect(corpus_path)
+    main.row_factory = sqlite3.Row
+    paths = []
+    t = time.perf_counter()
+    for user_id, matches in user_matches(users, per_user):
+        path = os.path.join(root, f"user_{user_id}", "matches.db")
+        os.makedirs(os.path.dirname(path))
+        paths.append(path)
+        with sqlite3.connect(path) as conn:
+            conn.executescript(USER_SCHEMA)
+            for filter_name, pk in matches:
+                row = main.execute(f"SELECT {COLUMNS} FROM manuscripts WHERE pk = ?", (pk,)).fetchone()
+                conn.execute(f"""
+                    INSERT OR REPLACE INTO manuscripts ({COLUMNS}, label, source_filter)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'new', ?)
+                """, (*row, filter_name))
+    write = time.perf_counter() - t
+
+    t = time.perf_counter()
+    for path in paths:
+        with sqlite3.connect(path) as conn:
+            conn.execute("SELECT * FROM manuscripts WHERE label = 'new'").fetchall()
+    read = time.perf_counter() - t
+    return size_of(*paths), write, read
+
+def bench_shared(corpus_path, users, per_user):
+    before = size_of(corpus_path)
+    conn = match_store.connect(corpus_path)
+    match_store.ensure_schema(conn)
+    t = time.perf_counter()
+    with conn:
+        for user_id, matches in user_matches(users, per_user):
+            match_store.store_matches(conn, user_id, matches, "2025-10-17T00:00:00+00:00")
+    write = time.perf_counter() - t
+
+    t = time.perf_counter()
+    for u in range(users):
+        match_store.fetch_matches(conn, str(u), label="new")
+    read = time.perf_counter() - t
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    return size_of(corpus_path) - before, write, read
+
+if __name__ == "__main__":
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else USERS
+    per_user = int(sys.argv[2]) if len(sys.argv) > 2 else MATCHES_PER_USER
+    with tempfile.TemporaryDirectory() as root:
+        corpus_path = os.path.join(root, "manuscript_db.db")
+        build_corpus(corpus_path)
+        ingest.connect(corpus_path).close()  # WAL, as in production
+        print(f"{users} users × {per_user} matches over a {CORPUS}-paper corpus")
+        for label, (size, write, read) in (
+            ("per-user copies", bench_copies(root, corpus_path, users, per_user)),
+            ("shared table   ", bench_shared(corpus_path, users, per_user)),
+        ):
+            print(f"  {label}: {size / 2**20:8.1f} MiB, write {write:6.2f}s "
+                  f"({users * per_user / write:8.0f} matches/s), read all new {read:5.2f}s")
@@ -0,0 +1,148 @@
+"""
+Digest rendering benchmark: the old per-user f-string formatting vs notifier's
+compiled templates with shared per-paper fragments.
+
+Builds N_USERS digests of MATCHES_PER_USER papers each, drawn from a pool of
+N_PAPERS shared papers (most papers match many users, as on a real day). The
+old path cleans up the stored author JSON for every row of every user; the new
+one reads authors_display, computed once at ingest. Reports digests/second.
+
+    python bench_render.py [N_USERS]
+"""
+import sys
+import json
+import time
+import random
+
+import ingest
+import notifier
+from notifier import t, fix_unicode_leaks, _escape_html
+
+N_USERS = 10000
+MATCHES_PER_USER = 20
+FILTERS_PER_USER = 3
+N_PAPERS = 2000
+LANGS = ("en", "cz", "es")
+
+def make_papers(n):
+    rnd = random.Random(7)
+    papers = []
+    for pk in range(1, n + 1):
+        authors = json.dumps([f"Autor Čermák {pk}-{i}" for i in range(rnd.randint(1, 12))])
+        papers.append({
+            "pk": pk,
+            "title": f"On the spectral gap of model {pk} & friends",
+            "link": f"http://arxiv.org/abs/2401.{pk:05d}v1",
+            "authors": authors,
+            "authors_display": ingest.display_authors(authors),
+            "summary": "quantum <b>many-body</b> scars; new bound" if pk % 3 else "",
+            "abstract": "We study " + "the model and its excitations " * 30,
+        })
+    return papers
+
+def make_digests(papers, n_users):
+    """Per user: language and rows (filter, paper), grouped the way notifier groups them."""
+    rnd = random.Random(11)
+    users = []
+    for _ in range(n_users):
+        picked = rnd.sample(papers, MATCHES_PER_USER)
+        rows = [(f"filter {i % FILTERS_PER_USER}", p) for i, p in enumerate(picked)]
+        users.append((rnd.choice(LANGS), rows))
+    return users
+
+# --- The formatting as it was before compiled templates ---
+def legacy_group(rows):
+    grouped = {}
+    for filter_name, p in rows:
+        grouped.setdefault(filter_name, []).append({
+            "title": p["title"], "link": p["link"], "authors": fix_unicode_leaks(p["authors"]),
+            "summary": p["summary"], "abstract": p["abstract"], "pk": p["pk"],
+        })
+    return grouped
+
+def legacy_plain(grouped, lang):
+    total = sum(len(v) for v in grouped.values())
+    lines = [f"{t('email.manage_filters', lang)} https://arxivbutler.com/\n", t("email.intro", lang), ""]
+    lines.append(f"{t('email.found_matches', lang).format(count=total)}")
+    if total > 10:
+        lines.append(t("email.too_many_matches", lang))
+    lines.append("")
+    for filter_name, matches in grouped.items():
+        lines.append(f"{t('email.filter_name', lang)}: {filter_name}")
+        for m in matches:
+            lines.append(f"• {m['title']}")
+            lines.append(m['link'])
+            if m.get("authors"):
+                lines.append(f"Authors: {m['authors']}")
+            if m.get("summary"):
+                lines.append(f"Novelty in topics: {m['summary']}")
+            if total <= 10 and m.get("abstract"):
+                lines.append(m["abstract"])
+            lines.append("")
+        lines.append("")
+    lines.append(t("email.disclaimer", lang))
+    return "\n".join(lines)
+
+def legacy_html(grouped, lang):
+    total = sum(len(v) for v in grouped.values())
+    sections = []
+    for filter_name, matches in grouped.items():
+        items = []
+        for m in matches:
+            authors_block = novelty_block = abstract_block = ""
+            if m.get("authors"):
+                authors_block = notifier.HTML_AUTHORS.format(authors=_escape_html(m["authors"])).strip()
+            if m.get("summary"):
+                novelty_block = notifier.HTML_NOVELTY.format(summary=_escape_html(m["summary"])).strip()
+            if total <= 10 and m.get("abstract"):
+                abstract_block = notifier.HTML_ABSTRACT.format(abstract=_escape_html(m["abstract"])).strip()
+            items.append(notifier.HTML_ITEM.format(
+                link=m["link"], title=_escape_html(m["title"]), authors_block=authors_block,
+                novelty_block=novelty_block, abstract_block=abstract_block))
+        sections.append(notifier.HTML_SECTION.format(
+            filter_label=t("email.filter_name", lang), filter_name=_escape_html(filter_name), items="".join(items)))
+    too_many = ('<p style="margin:0 0 12px 0; color:#BE6E46;">' + t("email.too_many_matches", lang) + "</p>") if total > 10 else ""
+    return notifier.HTML_OUTER.format(
+        subject=t("email.subject", lang),
+        intro=notifier.HTML_INTRO.format(intro=t("email.intro", lang), manage_link=notifier.MANAGE_LINK,
+                                         manage_filters=t("email.manage_filters", lang)),
+        summary=notifier.HTML_SUMMARY.format(found=t("email.found_matches", lang).format(count=total), too_many=too_many),
+        sections="".join(sections),
+        more="",
+        disclaimer=notifier.HTML_DISCLAIMER.format(disclaimer=t("email.disclaimer", lang)),
+        year=time.localtime().tm_year,
+    )
+
+def legacy(users):
+    for lang, rows in users:
+        grouped = legacy_group(rows)
+        yield legacy_plain(grouped, lang), legacy_html(grouped, lang)
+
+# --- notifier as it is now ---
+def compiled(users):
+    notifier.clear_fragment_cache()
+    for lang, rows in users:
+        grouped = {}
+        for filter_name, p in rows:
+            grouped.setdefault(filter_name, []).append({
+                "title": p["title"], "link": p["link"], "authors": p["authors_display"],
+                "summary": p["summary"], "abstract": p["abstract"], "pk": p["pk"],
+            })
+        yield notifier.format_email_plain(grouped, lang), notifier.format_email_html(grouped, lang)
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else N_USERS
+    papers = make_papers(N_PAPERS)
+    users = make_digests(papers, n)
+    print(f"{n} users × {MATCHES_PER_USER} matches from {N_PAPERS} shared papers")
+
+    # Both paths must produce the same e-mails
+    for (plain_a, html_a), (plain_b, html_b) in zip(legacy(users[:200]), compiled(users[:200])):
+        assert plain_a == plain_b and html_a == html_b
+
+    for label, run in (("legacy  ", legacy), ("compiled", compiled)):
+        t0 = time.perf_counter()
+        size = sum(len(plain) + len(html) for plain, html in run(users))
+        elapsed = time.perf_counter() - t0
+        print(f"  {label}: {n / elapsed:8.1f} digests/s ({elapsed:.2f}s, {size / 2**20:.0f} MiB rendered)")
+    print(f"  fragment cache: {len(notifier._FRAGMENTS)} paper blocks rendered for {n * MATCHES_PER_USER} listings")
@@ -0,0 +1,94 @@
+"""
+SMTP delivery benchmark: one connection per message (the old send_email) vs
+mailer.SMTPPool with 1 and SMTP_CONNECTIONS connections.
+
+Runs against a built-in local SMTP sink that accepts everything. Session setup
+(TCP, STARTTLS, AUTH against a remote server) is simulated by a delay before
+the greeting, and each message costs a smaller delay after DATA. Reports
+messages/second.
+
+    python bench_smtp.py [N_MESSAGES]
+"""
+import sys
+import time
+import smtplib
+import threading
+import socketserver
+
+import mailer
+
+N_MESSAGES = 200
+SESSION_SETUP = 0.25   # seconds before the greeting
+PER_MESSAGE = 0.02     # seconds to accept one message
+
+class Sink(socketserver.StreamRequestHandler):
+    received = 0
+    lock = threading.Lock()
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        time.sleep(SESSION_SETUP)
+        self.reply("220 sink ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            verb = line[:4].upper()
+            if verb == b"EHLO":
+                self.reply("250-sink")
+                self.reply("250 8BITMIME")
+            elif verb == b"DATA":
+                self.reply("354 go ahead")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                time.sleep(PER_MESSAGE)
+                with Sink.lock:
+                    Sink.received += 1
+                self.reply("250 queued")
+            elif verb == b"QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")
+
+class Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def messages(n):
+    for i in range(n):
+        yield i, mailer.build_message("bench@localhost", f"user{i}@localhost", "Your arXiv digest",
+                                      "plain body " * 200, "<p>html body</p>" * 200)
+
+def per_message(host, port, n):
+    for _, msg in messages(n):
+        with smtplib.SMTP(host, port) as server:
+            server.send_message(msg)
+
+def pooled(host, port, n, size):
+    with mailer.SMTPPool("bench", None, size=size, host=host, port=port, starttls=False) as pool:
+        for _, error in pool.send_all(messages(n)):
+            if error:
+                raise error
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else N_MESSAGES
+    server = Server(("127.0.0.1", 0), Sink)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    print(f"{n} messages; sink: {SESSION_SETUP}s session setup, {PER_MESSAGE}s per message")
+
+    for label, run in (
+        ("connection per message", lambda: per_message(host, port, n)),
+        ("pool, 1 connection    ", lambda: pooled(host, port, n, 1)),
+        (f"pool, {mailer.SMTP_CONNECTIONS} connections   ", lambda: pooled(host, port, n, mailer.SMTP_CONNECTIONS)),
+    ):
+        before = Sink.received
+        t = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - t
+        assert Sink.received - before == n
+        print(f"  {label}: {n / elapsed:7.1f} messages/s")
+    server.shutdown()
@@ -0,0 +1,130 @@
+"""
+Website load test: requests/second for concurrent logins and filter previews.
+It compares a fresh sqlite3 connection per request (as before) with the
+connection pools in website/db.py.
+
+The Flask app is served by the threaded development server on scratch data:
+- users.db with N_USERS accounts, using cheap password hashes so the test
+  measures the database and not PBKDF2;
+- a synthetic corpus of N_PAPERS papers.
+CLIENTS threads drive it over keep-alive HTTP sessions. Half of the requests
+are logins; the other half are previews drawn from a small keyword vocabulary,
+so many of them are preview-cache hits, as when someone is typing.
+
+    python bench_website.py [N_REQUESTS]
+"""
+import os
+import sys
+import json
+import time
+import logging
+import random
+import sqlite3
+import tempfile
+import threading
+
+import requests
+from werkzeug.security import generate_password_hash
+from werkzeug.serving import make_server
+
+import ingest
+from daily_update import CREATE_TABLE_SQL, CREATE_FTS_SQL
+
+WEBSITE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "website")
+N_REQUESTS = 4000
+CLIENTS = 8
+N_USERS = 1000
+N_PAPERS = 20000
+VOCAB = [f"w{i}" for i in range(300)]
+
+def build_data(tmp):
+    users_path = os.path.join(tmp, "users.db")
+    with sqlite3.connect(users_path) as conn:
+        conn.execute("""
+            CREATE TABLE users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, email TEXT UNIQUE NOT NULL,
+                password TEXT NOT NULL, lang TEXT
+            )
+        """)
+        pwd_hash = generate_password_hash("password123", method="pbkdf2:sha256:1")
+        conn.executemany("INSERT INTO users (email, password) VALUES (?, ?)",
+                         ((f"user{i}@example.com", pwd_hash) for i in range(N_USERS)))
+
+    main_path = os.path.join(tmp, "manuscript_db.db")
+    rnd = random.Random(1)
+    conn = ingest.connect(main_path)
+    conn.execute(CREATE_TABLE_SQL)
+    conn.execute(CREATE_FTS_SQL)
+    with conn:
+        ingest.insert_papers(conn, [{
+            "id": f"2401.{i:05d}", "title": " ".join(rnd.choices(VOCAB, k=8)), "authors": json.dumps(["A. Author"]),
+            "orcids": "", "keywords": "", "abstract": " ".join(rnd.choices(VOCAB, k=120)),
+            "link": f"http://arxiv.org/abs/2401.{i:05d}", "published_timestamp": "2024-01-01T00:00:00+00:00",
+            "added_timestamp": "2024-01-01T00:00:00",
+        } for i in range(N_PAPERS)])
+    conn.close()
+    return users_path, main_path
+
+def client(base, n, seed, errors):
+    rnd = random.Random(seed)
+    http = requests.Session()
+    for i in range(n):
+        if i % 2:
+            r = http.post(f"{base}/", data={"email": f"user{rnd.randrange(N_USERS)}@example.com",
+                                             "password": "password123"}, allow_redirects=False)
+            ok = r.status_code == 302
+        else:
+            r = http.post(f"{base}/filters/check", data={"keyword_group_0": rnd.sample(VOCAB[:40], 2),
+                                                         "keyword_group_1": [rnd.choice(VOCAB[:40])]})
+            ok = r.status_code == 200 and "matches" in r.json()
+        if not ok:
+            errors.append(r.status_code)
+
+def run(base, n):
+    errors = []
+    threads = [threading.Thread(target=client, args=(base, n // CLIENTS, seed, errors)) for seed in range(CLIENTS)]
+    t = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - t
+    assert not errors, errors[:5]
+    return (n // CLIENTS * CLIENTS) / elapsed
+
+def fresh_connection(path, read_only=False):
+    """The old way: a default connection per request, closed afterwards."""
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else N_REQUESTS
+    tmp = tempfile.mkdtemp(prefix="bench_website_")
+    users_path, main_path = build_data(tmp)
+
+    # The website resolves its data files (and translation.json) from these
+    os.chdir(WEBSITE_DIR)
+    sys.path.insert(0, WEBSITE_DIR)
+    import config
+    config.USER_DB_PATH, config.MAIN_DB_PATH = users_path, main_path
+    import db
+    import preview
+    from app import app
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)  # no access log line per request
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    print(f"{n} requests from {CLIENTS} clients (logins + previews); {N_USERS} users, {N_PAPERS} papers")
+
+    pooled_connect, pool_size = db.connect, db.POOL_SIZE
+    for label, connect, size in (("connection per request", fresh_connection, 0),
+                                 ("pooled connections    ", pooled_connect, pool_size)):
+        db.connect, db.POOL_SIZE = connect, size
+        db._pools.clear()
+        preview.PREVIEWS = preview.PreviewCache()
+        rate = run(base, n)
+        opened = sum(pool.opened for pool in db._pools.values())
+        print(f"  {label}: {rate:7.1f} requests/s, {opened} connection(s) opened")
+    server.shutdown()
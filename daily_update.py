@@ -1,17 +1,23 @@
 import os
 import sqlite3
-import json
-import feedparser
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta, timezone
-from time import mktime
-import time
+
+import ingest
+import match_store
+from arxiv_client import ARXIV_API_URL, fetch_stream, prune_cache
+from atom_parser import iter_papers
 
 # Config
 DB_PATH = os.path.join(os.path.dirname(__file__), "data", "manuscript_db.db")
 N_DAYS = 4
 BATCH_SIZE = 500
-ARXIV_API_URL = "http://export.arxiv.org/api/query"
+HARVEST_WORKERS = 4  # categories in flight; request pacing is up to arxiv_client
 PRUNE_DAYS = 730  # ~2 years
+# Papers can show up in the API days after their submission time (announcement
+# cycle, weekends, moderation holds), so paging continues this far past the stored
+# watermark: never less than the fixed 4-day look-back it replaced.
+WATERMARK_OVERLAP = timedelta(days=4)
 
 # Search categories
 physics_categories = [ "astro-ph", "cond-mat.dis-nn", "cond-mat.mes-hall", "cond-mat.mtrl-sci", "cond-mat.other",
@@ -44,34 +50,82 @@ SEARCH_QUERIES = (
 # Ensure data directory exists
 os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 
+# `pk` aliases the rowid, so manuscripts_fts rowids and the filter watermarks in
+# filtering.py stay valid across VACUUM. AUTOINCREMENT keeps pruning the newest
+# rows from handing their pks out again, below those watermarks.
+# Older databases: see migrate_manuscripts_pk.py
 CREATE_TABLE_SQL = """
 CREATE TABLE IF NOT EXISTS manuscripts (
-    id TEXT PRIMARY KEY,
+    pk INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
     title TEXT NOT NULL,
     authors TEXT NOT NULL,
+    authors_display TEXT,
     orcids TEXT,
     keywords TEXT,
     abstract TEXT,
     link TEXT NOT NULL,
     published_timestamp TEXT NOT NULL,
-    added_timestamp TEXT NOT NULL
+    added_timestamp TEXT NOT NULL,
+    summary TEXT DEFAULT ''
 );
 """
 
 CREATE_FTS_SQL = """
 CREATE VIRTUAL TABLE IF NOT EXISTS manuscripts_fts USING fts5(
-    title, abstract, authors, keywords, content='manuscripts', content_rowid='id'
+    title, abstract, authors, keywords, content='manuscripts', content_rowid='pk'
+);
+"""
+
+CREATE_INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS idx_manuscripts_added ON manuscripts(added_timestamp);
+"""
+
+# Small key/value store for harvester progress: the OAI-PMH datestamp and the
+# per-category watermarks ("api:<category>" -> newest "published_timestamp id")
+CREATE_STATE_SQL = """
+CREATE TABLE IF NOT EXISTS harvest_state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
 );
 """
 
 def initialize_database():
-    with sqlite3.connect(DB_PATH) as conn:
+    with ingest.connect(DB_PATH) as conn:
         conn.execute(CREATE_TABLE_SQL)
+        # Added after the first release; older rows keep NULL and notifier.py formats them itself
+        if "authors_display" not in [row[1] for row in conn.execute("PRAGMA table_info(manuscripts)")]:
+            conn.execute("ALTER TABLE manuscripts ADD COLUMN authors_display TEXT")
         conn.execute(CREATE_FTS_SQL)
+        conn.execute(CREATE_INDEX_SQL)
+        conn.execute(CREATE_STATE_SQL)
+        match_store.ensure_schema(conn)
     print(f"Database initialized at {DB_PATH}")
 
-def fetch_arxiv_papers_for_query(search_query, n_days, batch_size):
+def watermark_key(search_query):
+    return f"api:{search_query}"
+
+def load_watermarks(queries):
+    """Newest (published datetime, arXiv id) already stored for each category."""
+    with ingest.connect(DB_PATH) as conn:
+        rows = dict(conn.execute("SELECT key, value FROM harvest_state WHERE key LIKE 'api:%'"))
+    watermarks = {}
+    for query in queries:
+        value = rows.get(watermark_key(query))
+        if value:
+            published, arxiv_id = value.split(" ", 1)
+            watermarks[query] = (datetime.fromisoformat(published), arxiv_id)
+    return watermarks
+
+def fetch_arxiv_papers_for_query(search_query, n_days, batch_size, watermark=None):
+    """
+    Page through a category newest-first and return the papers published after
+    the cutoff. With a watermark, paging stops WATERMARK_OVERLAP before the newest
+    paper stored last time instead of going all the way back to the cutoff.
+    """
     cutoff = datetime.now(timezone.utc) - timedelta(days=n_days)
+    if watermark:
+        cutoff = max(cutoff, watermark[0] - WATERMARK_OVERLAP)
     all_new_papers = []
     start = 0
 
@@ -82,90 +136,76 @@ def fetch_arxiv_papers_for_query(search_query, n_days, batch_size):
             f"&sortBy=submittedDate&sortOrder=descending"
         )
 
-        print(f"\nFetching {search_query} results {start}–{start + batch_size - 1} ...")
-        feed = feedparser.parse(query)
-
-        if not feed.entries:
-            print("No more entries returned from arXiv.")
-            break
-
+        print(f"Fetching {search_query} results {start}–{start + batch_size - 1} ...")
         batch_papers = []
         all_older = True
-
-        for entry in feed.entries:
-            published_dt = datetime.fromtimestamp(mktime(entry.published_parsed), tz=timezone.utc)
-
+        n_entries = 0
+        first_date = last_date = None
+
+        # Entries are parsed as the page downloads
+        for published_dt, paper in iter_papers(fetch_stream(query)):
+            n_entries += 1
+            first_date = first_date or published_dt
+            last_date = published_dt
             if published_dt >= cutoff:
                 all_older = False
-                arxiv_id = entry.id.split('/')[-1]
-                title = entry.title.strip().replace('\n', ' ')
-                abstract = entry.summary.strip().replace('\n', ' ')
-                authors = [author.name for author in entry.authors]
-                keywords = [tag['term'] for tag in entry.tags] if 'tags' in entry else []
-                link = entry.link
-
-                batch_papers.append({
-                    "id": arxiv_id,
-                    "title": title,
-                    "authors": json.dumps(authors),
-                    "orcids": json.dumps([]),
-                    "keywords": json.dumps(keywords),
-                    "abstract": abstract,
-                    "link": link,
-                    "published_timestamp": published_dt.isoformat(),
-                    "added_timestamp": datetime.now(timezone.utc).isoformat()
-                })
-
-        if feed.entries:
-            first_date = datetime.fromtimestamp(mktime(feed.entries[0].published_parsed))
-            last_date = datetime.fromtimestamp(mktime(feed.entries[-1].published_parsed))
-            print(f"Batch covers: {first_date.date()} → {last_date.date()}")
+                batch_papers.append(paper)
+
+        if not n_entries:
+            print(f"[{search_query}] No more entries returned from arXiv.")
+            break
+
+        print(f"[{search_query}] Batch covers: {first_date.date()} → {last_date.date()}")
 
         all_new_papers.extend(batch_papers)
-        print(f"Fetched {len(feed.entries)} → Keeping {len(batch_papers)}")
+        print(f"[{search_query}] Fetched {n_entries} → Keeping {len(batch_papers)}")
 
         if all_older:
-            print("All entries in this batch are older than cutoff — stopping.")
+            print(f"[{search_query}] All entries in this batch are older than cutoff — stopping.")
+            break
+        if n_entries < batch_size:
+            print(f"[{search_query}] Short batch, nothing further back — stopping.")
             break
 
         start += batch_size
-        time.sleep(3)
 
     return all_new_papers
 
-def insert_papers_to_db(papers):
+def harvest_categories(queries, n_days, batch_size, workers=HARVEST_WORKERS, watermarks=None):
+    """
+    Fetch several categories concurrently. Yields (query, papers) as each category
+    finishes, so the caller can insert one while the others are still downloading.
+    """
+    watermarks = watermarks or {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(fetch_arxiv_papers_for_query, query, n_days, batch_size, watermarks.get(query)): query
+            for query in queries
+        }
+        for future in as_completed(futures):
+            query = futures[future]
+            try:
+                yield query, future.result()
+            except Exception as e:
+                print(f"❌ [{query}] Harvest failed: {e}")
+
+def insert_papers_to_db(papers, search_query=None):
+    """
+    Insert papers; with `search_query`, also advance that category's watermark to
+    the newest of them in the same transaction, so it never gets ahead of the data.
+    """
     if not papers:
         print("No new papers to insert.")
         return
 
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        new_count = 0
-        for paper in papers:
-            try:
-                cursor.execute("""
-                    INSERT INTO manuscripts (
-                        id, title, authors, orcids, keywords, abstract,
-                        link, published_timestamp, added_timestamp
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    paper["id"], paper["title"], paper["authors"],
-                    paper["orcids"], paper["keywords"], paper["abstract"],
-                    paper["link"], paper["published_timestamp"], paper["added_timestamp"]
-                ))
-
-                cursor.execute("""
-                    INSERT INTO manuscripts_fts (rowid, title, abstract, authors, keywords)
-                    VALUES ((SELECT rowid FROM manuscripts WHERE id = ?), ?, ?, ?, ?)
-                """, (
-                    paper["id"], paper["title"], paper["abstract"],
-                    paper["authors"], paper["keywords"]
-                ))
-
-                new_count += 1
-            except sqlite3.IntegrityError:
-                continue  # Duplicate
-        conn.commit()
+    with ingest.connect(DB_PATH) as conn:
+        new_count = ingest.insert_papers(conn, papers)
+        if search_query:
+            newest = max(papers, key=lambda p: datetime.fromisoformat(p["published_timestamp"]))
+            conn.execute("""
+                INSERT INTO harvest_state (key, value) VALUES (?, ?)
+                ON CONFLICT(key) DO UPDATE SET value = excluded.value
+            """, (watermark_key(search_query), f"{newest['published_timestamp']} {newest['id']}"))
     print(f"Inserted {new_count} new manuscript(s).")
 
 def prune_old_papers(days=PRUNE_DAYS):
@@ -174,23 +214,24 @@ def prune_old_papers(days=PRUNE_DAYS):
     with sqlite3.connect(DB_PATH) as conn:
         cur = conn.cursor()
 
-        # Collect rowids to delete first (so we can also delete from FTS)
-        cur.execute("SELECT rowid FROM manuscripts WHERE published_timestamp < ?", (cutoff_iso,))
-        rowids = [r[0] for r in cur.fetchall()]
-        to_delete = len(rowids)
+        cur.execute("SELECT COUNT(*) FROM manuscripts WHERE published_timestamp < ?", (cutoff_iso,))
+        to_delete = cur.fetchone()[0]
 
         if to_delete == 0:
             print("Prune: nothing to remove.")
             return 0
 
-        # Build placeholder list safely
-        placeholders = ",".join(["?"] * to_delete)
+        # External-content FTS: remove index entries first, while the original
+        # column values are still there to tell FTS which tokens to drop
+        cur.execute("""
+            INSERT INTO manuscripts_fts (manuscripts_fts, rowid, title, abstract, authors, keywords)
+            SELECT 'delete', rowid, title, abstract, authors, keywords
+            FROM manuscripts WHERE published_timestamp < ?
+        """, (cutoff_iso,))
 
         # Delete from manuscripts (content table)
-        cur.execute(f"DELETE FROM manuscripts WHERE rowid IN ({placeholders})", rowids)
-
-        # Delete matching rows from FTS index
-        cur.execute(f"DELETE FROM manuscripts_fts WHERE rowid IN ({placeholders})", rowids)
+        cur.execute("DELETE FROM manuscripts WHERE published_timestamp < ?", (cutoff_iso,))
+        match_store.prune_orphans(conn)
 
         conn.commit()
 
@@ -202,12 +243,14 @@ if __name__ == "__main__":
     print(datetime.now(timezone.utc).isoformat())
     initialize_database()
     total_inserted = 0
-    for query in SEARCH_QUERIES:
-        new_papers = fetch_arxiv_papers_for_query(query, N_DAYS, BATCH_SIZE)
-        insert_papers_to_db(new_papers)
+    # Inserts stay on this thread: one SQLite writer, fed as categories complete
+    watermarks = load_watermarks(SEARCH_QUERIES)
+    for query, new_papers in harvest_categories(SEARCH_QUERIES, N_DAYS, BATCH_SIZE, watermarks=watermarks):
+        insert_papers_to_db(new_papers, query)
         total_inserted += len(new_papers)
     print(f"\n✅ Done. Total new manuscripts inserted: {total_inserted}")
 
     # Prune anything older than ~2 years
     pruned = prune_old_papers(PRUNE_DAYS)
     print(f"🧹 Prune complete. Removed: {pruned}")
+    print(f"🧹 Dropped {prune_cache()} stale cached response(s).")
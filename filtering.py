@@ -1,15 +1,25 @@
 import os
+import sys
 import json
 import sqlite3
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timezone
 from glob import glob
 
+import match_store
+from matching import PhraseIndex, MATCH_COLUMNS
+
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 MAIN_DB_PATH = os.path.join(SCRIPT_DIR, "data", "manuscript_db.db")
 USERS_ROOT = os.path.join(SCRIPT_DIR, "data", "users")
-
-print('')
-print(datetime.now(timezone.utc).isoformat())
+# Filters further behind than this many manuscripts are caught up with their own
+# FTS query instead of dragging the shared sweep back over the whole corpus.
+SWEEP_MAX_BACKLOG = 50000
+# Processes for matching; the sweep is split into rowid slices, catch-up queries
+# run one filter per task. Below PARALLEL_MIN_ROWS a pool costs more than it saves.
+WORKERS = int(os.getenv("FILTER_WORKERS", str(os.cpu_count() or 1)))
+PARALLEL_MIN_ROWS = 20000
+SHARDS_PER_WORKER = 4
 
 def build_fts_query_from_filter(filter_data):
     groups = filter_data.get("keyword_groups", [])
@@ -17,145 +27,252 @@ def build_fts_query_from_filter(filter_data):
         return None
     return " AND ".join(["(" + " OR ".join(group) + ")" for group in groups])
 
-def ensure_user_db_schema(user_db_path):
-    with sqlite3.connect(user_db_path) as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS manuscripts (
-                id TEXT PRIMARY KEY,
-                title TEXT NOT NULL,
-                authors TEXT NOT NULL,
-                orcids TEXT,
-                keywords TEXT,
-                abstract TEXT,
-                link TEXT NOT NULL,
-                published_timestamp TEXT NOT NULL,
-                added_timestamp TEXT NOT NULL,
-                label TEXT NOT NULL CHECK(label IN ('new', 'old')),
-                source_filter TEXT,
-                summary TEXT
-            );
-        """)
-        # Make sure 'summary' exists for pre-existing DBs
-        cursor.execute("PRAGMA table_info(manuscripts)")
-        cols = [r[1] for r in cursor.fetchall()]
-        if "summary" not in cols:
-            cursor.execute("ALTER TABLE manuscripts ADD COLUMN summary TEXT DEFAULT ''")
-        conn.commit()
-
-user_dirs = sorted(glob(os.path.join(USERS_ROOT, "user_*")))
-results = []
-
-with sqlite3.connect(MAIN_DB_PATH) as main_conn:
-    main_conn.row_factory = sqlite3.Row
-    main_cursor = main_conn.cursor()
+def parse_timestamp(value):
+    """Parse an ISO timestamp, treating naive values as UTC. None if unparsable."""
+    try:
+        dt = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
 
+def load_filters(user_dirs):
+    """Read every user's filter files. Returns a list of filter dicts."""
+    filters = []
     for user_dir in user_dirs:
-        filter_files = glob(os.path.join(user_dir, "filter_*.json"))
-        user_db_path = os.path.join(user_dir, "matches.db")
-        ensure_user_db_schema(user_db_path)
-
-        for filter_file in filter_files:
-            print(f"🔍 Working on filter: {filter_file}")
+        for filter_file in sorted(glob(os.path.join(user_dir, "filter_*.json"))):
             with open(filter_file, "r", encoding="utf-8") as f:
                 filter_data = json.load(f)
 
-            fts_query = build_fts_query_from_filter(filter_data)
-            if not fts_query:
-                print("⚠️  Skipping: No keywords defined.")
-                continue
+            filters.append({
+                "user_dir": user_dir,
+                "path": filter_file,
+                "name": os.path.basename(filter_file).replace("filter_", "").replace(".json", ""),
+                "data": filter_data,
+            })
+    return filters
+
+def filter_watermark(main_cursor, filter_data):
+    """
+    Highest manuscripts rowid this filter has already been matched against.
+    Filters saved before watermarks existed only have 'last_scan'; translate it
+    to the last rowid added before that moment.
+    """
+    last_rowid = filter_data.get("last_rowid")
+    if isinstance(last_rowid, int) and last_rowid >= 0:
+        return last_rowid
+
+    last_scan_dt = parse_timestamp(filter_data.get("last_scan", "1970-01-01T00:00:00"))
+    if last_scan_dt is None:
+        print("⚠️  Invalid last_scan timestamp, using fallback.")
+        return 0
+    # Whole-second cut: re-matching a paper from the boundary second is harmless,
+    # skipping one is not.
+    last_scan_iso = last_scan_dt.astimezone(timezone.utc).replace(tzinfo=None).isoformat(timespec="seconds")
+    main_cursor.execute(
+        "SELECT COALESCE(MAX(rowid), 0) FROM manuscripts WHERE added_timestamp < ?",
+        (last_scan_iso,),
+    )
+    return main_cursor.fetchone()[0]
+
+def sweep_matches(main_cursor, index, watermarks, low, high):
+    """
+    Scan the manuscripts with rowid in (low, high] once and match them against every
+    filter in `index`. Returns {filter key: [(rowid, coverage)]}; a row only counts
+    for a filter if it lies above that filter's own watermark.
+    """
+    main_cursor.execute("""
+        SELECT rowid AS rowid, * FROM manuscripts
+        WHERE rowid > ? AND rowid <= ?
+    """, (low, high))
+
+    hits = {}
+    scanned = 0
+    for row in main_cursor:
+        scanned += 1
+        for key, coverage in index.match_coverage([row[col] for col in MATCH_COLUMNS]):
+            if row["rowid"] > watermarks[key]:
+                hits.setdefault(key, []).append((row["rowid"], coverage))
+    print(f"📄 Swept {scanned} manuscript(s) above rowid {low}.")
+    return hits
+
+def fts_matches(main_cursor, fts_query, low, high):
+    """Manuscripts with rowid in (low, high] matching `fts_query`, joined in SQL."""
+    main_cursor.execute("""
+        SELECT m.rowid AS rowid, m.*
+        FROM manuscripts_fts
+        JOIN manuscripts AS m ON m.rowid = manuscripts_fts.rowid
+        WHERE manuscripts_fts MATCH ?
+          AND manuscripts_fts.rowid > ? AND manuscripts_fts.rowid <= ?
+    """, (fts_query, low, high))
+    return main_cursor.fetchall()
+
+def catch_up_matches(main_cursor, key, groups, fts_query, low, high):
+    """fts_matches for one filter as (rowid, coverage) pairs, like sweep_matches."""
+    index = PhraseIndex()
+    index.add_filter(key, groups)
+    matched = []
+    for row in fts_matches(main_cursor, fts_query, low, high):
+        coverage = dict(index.match_coverage([row[col] for col in MATCH_COLUMNS])).get(key)
+        matched.append((row["rowid"], coverage))
+    return matched
+
+# --- Process pool ---
+def _read_only(db_path):
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def _sweep_shard(args):
+    """Pool task: sweep rowids (low, high] with this process's own index and connection."""
+    db_path, specs, watermarks, low, high = args
+    index = PhraseIndex()
+    for key, groups in specs:
+        index.add_filter(key, groups)
+    conn = _read_only(db_path)
+    try:
+        return sweep_matches(conn.cursor(), index, watermarks, low, high)
+    finally:
+        conn.close()
+
+def _fts_task(args):
+    """Pool task: catch up one lagging filter."""
+    db_path, key, groups, fts_query, low, high = args
+    conn = _read_only(db_path)
+    try:
+        return key, catch_up_matches(conn.cursor(), key, groups, fts_query, low, high)
+    finally:
+        conn.close()
 
-            last_scan = filter_data.get("last_scan", "1970-01-01T00:00:00")
-            try:
-                last_scan_dt = datetime.fromisoformat(last_scan)
-                if last_scan_dt.tzinfo is None:
-                    last_scan_dt = last_scan_dt.replace(tzinfo=timezone.utc)
-            except ValueError:
-                print("⚠️  Invalid last_scan timestamp, using fallback.")
-                last_scan_dt = datetime(1970, 1, 1, tzinfo=timezone.utc)
-
-            # FTS query
-            main_cursor.execute("""
-                SELECT title FROM manuscripts_fts
-                WHERE manuscripts_fts MATCH ?
-            """, (fts_query,))
-            fts_titles = [row["title"] for row in main_cursor.fetchall()]
-            print(f"📄 Found {len(fts_titles)} total matches from FTS.")
-
-            if not fts_titles:
-                # Still update timestamp to avoid infinite old scans
-                filter_data["last_scan"] = datetime.now(timezone.utc).isoformat()
-                with open(filter_file, "w", encoding="utf-8") as f:
-                    json.dump(filter_data, f, indent=2)
-                print("⏱️  No matches found — updated timestamp.")
+def parallel_matches(pool, workers, db_path, specs, watermarks, low, high, lagging):
+    """
+    Run the sweep over (low, high] split into rowid slices, plus one FTS catch-up
+    per lagging (key, groups, query, watermark), on `pool`.
+    Returns {filter key: [(rowid, coverage)]}.
+    """
+    tasks = []
+    if specs:
+        n = workers * SHARDS_PER_WORKER
+        bounds = [low + (high - low) * i // n for i in range(n + 1)]
+        tasks = [(db_path, specs, watermarks, a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+    catch_up = pool.map(_fts_task, [(db_path, key, groups, query, mark, high)
+                                    for key, groups, query, mark in lagging])
+
+    hits = {}
+    # Slices come back in rowid order, so each filter's list stays sorted
+    for shard in pool.map(_sweep_shard, tasks):
+        for key, matched in shard.items():
+            hits.setdefault(key, []).extend(matched)
+    for key, matched in catch_up:
+        if matched:
+            hits[key] = matched
+    return hits
+
+def save_filter(flt, high, scan_started):
+    """
+    Move a filter's watermark to `high`. The file is read again first: a run takes
+    a while, and an edit or delete from the website in the meantime must win.
+    Returns False if the filter was left alone for that reason.
+    """
+    try:
+        with open(flt["path"], "r", encoding="utf-8") as f:
+            current = json.load(f)
+    except FileNotFoundError:
+        return False  # deleted during the run
+    except ValueError:
+        return False  # caught mid-write by the website; the next run catches up
+    if current.get("keyword_groups") != flt["data"].get("keyword_groups"):
+        return False  # edited during the run; the editor reset its watermark already
+
+    current["last_rowid"] = high
+    current["last_scan"] = scan_started.isoformat()
+    tmp_path = f"{flt['path']}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(current, f, indent=2)
+    os.replace(tmp_path, flt["path"])
+    return True
+
+def main(workers=WORKERS):
+    user_dirs = sorted(glob(os.path.join(USERS_ROOT, "user_*")))
+    filters = load_filters(user_dirs)
+    hits = {}
+    active = []
+    scan_started = datetime.now(timezone.utc)
+
+    with sqlite3.connect(MAIN_DB_PATH) as main_conn:
+        main_conn.row_factory = sqlite3.Row
+        main_cursor = main_conn.cursor()
+
+        # Everything up to this rowid is handled now; later inserts go to the next run.
+        main_cursor.execute("SELECT COALESCE(MAX(rowid), 0) FROM manuscripts")
+        high = main_cursor.fetchone()[0]
+
+        index = PhraseIndex()
+        specs = []
+        watermarks = {}
+        lagging = []
+        for key, flt in enumerate(filters):
+            groups = flt["data"].get("keyword_groups", [])
+            if not groups:
+                print(f"⚠️  Skipping: No keywords defined in {flt['path']}.")
                 continue
+            watermarks[key] = filter_watermark(main_cursor, flt["data"])
+            active.append(flt)
+            if high - watermarks[key] > SWEEP_MAX_BACKLOG:
+                lagging.append(key)
+            elif index.add_filter(key, groups):
+                specs.append((key, groups))
+            else:
+                print(f"⚠️  Skipping: No usable keywords in {flt['path']}.")
+                del watermarks[key]
+                active.pop()
+        print(f"🔍 Compiled {len(index)} filter(s) from {len(user_dirs)} user(s) into {index.phrase_count} phrase(s).")
+
+        low = min((watermarks[key] for key, _ in specs), default=high)
+        for key in lagging:
+            print(f"🔍 Catching up filter: {filters[key]['path']} (rowid {watermarks[key]} → {high})")
+        lagging_queries = [(key, filters[key]["data"]["keyword_groups"],
+                            build_fts_query_from_filter(filters[key]["data"]), watermarks[key])
+                           for key in lagging]
+
+        if workers > 1 and (high - low >= PARALLEL_MIN_ROWS or len(lagging) > 1):
+            print(f"⚙️  Matching with {workers} processes.")
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                hits = parallel_matches(pool, workers, MAIN_DB_PATH, specs, watermarks, low, high, lagging_queries)
+        else:
+            if specs:
+                hits = sweep_matches(main_cursor, index, watermarks, low, high)
+            for key, groups, query, mark in lagging_queries:
+                matched = catch_up_matches(main_cursor, key, groups, query, mark, high)
+                if matched:
+                    hits[key] = matched
+
+    per_user = {}
+    for key, matched in hits.items():
+        flt = filters[key]
+        print(f"🆕 {len(matched)} new matches for {flt['path']}.")
+        per_user.setdefault(flt["user_dir"], []).extend((flt["name"], *match) for match in matched)
+
+    # All users' matches go to the shared table in one transaction
+    with match_store.connect(MAIN_DB_PATH) as conn:
+        match_store.ensure_schema(conn)
+        for user_dir, matches in per_user.items():
+            added_count = match_store.store_matches(
+                conn, match_store.user_id_for(user_dir), matches, scan_started.isoformat())
+            print(f"✅ Inserted {added_count} match(es) for {os.path.basename(user_dir)}.")
+
+    saved = 0
+    for flt in active:
+        if save_filter(flt, high, scan_started):
+            saved += 1
+        else:
+            print(f"↩️  {flt['path']} was edited or removed during the run; watermark left alone.")
+    print(f"⏱️  Watermarks moved to rowid {high} for {saved} filter(s).\n")
+
+    print("✅ Filters processed and matches stored.")
 
-            # Fetch all matching rows from manuscripts (includes 'summary')
-            placeholder = ",".join("?" for _ in fts_titles)
-            main_cursor.execute(f"""
-                SELECT *
-                FROM manuscripts
-                WHERE title IN ({placeholder})
-            """, fts_titles)
-            all_matches = main_cursor.fetchall()
-
-            # Filter by added_timestamp
-            new_matches = []
-            for row in all_matches:
-                added_dt = datetime.fromisoformat(row["added_timestamp"])
-                if added_dt.tzinfo is None:
-                    added_dt = added_dt.replace(tzinfo=timezone.utc)
-                if added_dt > last_scan_dt:
-                    new_matches.append(row)
-
-            print(f"🆕 {len(new_matches)} new matches found since last scan.")
-
-            added_count = 0
-            if new_matches:
-                with sqlite3.connect(user_db_path) as user_conn:
-                    user_conn.row_factory = sqlite3.Row
-                    user_cursor = user_conn.cursor()
-                    for match in new_matches:
-                        match_dict = dict(match)
-                        manuscript_id = match_dict["id"]
-                        added_timestamp = match_dict["added_timestamp"]
-
-                        user_cursor.execute("SELECT label FROM manuscripts WHERE id = ?", (manuscript_id,))
-                        existing = user_cursor.fetchone()
-                        label = existing["label"] if existing else "new"
-
-                        filter_name = os.path.basename(filter_file).replace("filter_", "").replace(".json", "")
-                        summary_val = (match_dict.get("summary") or "").strip()
-
-                        user_cursor.execute("""
-                            INSERT OR REPLACE INTO manuscripts (
-                                id, title, authors, orcids, keywords,
-                                abstract, link, published_timestamp,
-                                added_timestamp, label, source_filter, summary
-                            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        """, (
-                            manuscript_id,
-                            match_dict["title"],
-                            match_dict["authors"],
-                            match_dict["orcids"],
-                            match_dict["keywords"],
-                            match_dict["abstract"],
-                            match_dict["link"],
-                            match_dict["published_timestamp"],
-                            added_timestamp,
-                            label,
-                            filter_name,
-                            summary_val
-                        ))
-                        added_count += 1
-                    user_conn.commit()
-            print(f"✅ Inserted {added_count} entries to {os.path.basename(user_db_path)}.")
-
-            # Update filter's last_scan
-            filter_data["last_scan"] = datetime.now(timezone.utc).isoformat()
-            with open(filter_file, "w", encoding="utf-8") as f:
-                json.dump(filter_data, f, indent=2)
-            print("⏱️  Timestamp updated.\n")
-
-results.append("✅ Filters processed and user match databases updated.")
-print("\n".join(results))
+if __name__ == "__main__":
+    print('')
+    print(datetime.now(timezone.utc).isoformat())
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else WORKERS)
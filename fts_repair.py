@@ -7,26 +7,28 @@ def rebuild_fts():
     with sqlite3.connect(DB_PATH) as conn:
         cursor = conn.cursor()
 
+        cursor.execute("PRAGMA table_info(manuscripts)")
+        if "pk" not in [row[1] for row in cursor.fetchall()]:
+            print("❌ manuscripts has no 'pk' column, run migrate_manuscripts_pk.py instead.")
+            return
+
         print("Dropping corrupted FTS table...")
         cursor.execute("DROP TABLE IF EXISTS manuscripts_fts")
 
         print("Recreating FTS table...")
         cursor.execute("""
             CREATE VIRTUAL TABLE manuscripts_fts USING fts5(
-                title, abstract, authors, keywords
+                title, abstract, authors, keywords, content='manuscripts', content_rowid='pk'
             );
         """)
 
-        print("Re-inserting data into FTS table...")
-        cursor.execute("SELECT title, abstract, authors, keywords FROM manuscripts")
-        rows = cursor.fetchall()
-        cursor.executemany("""
-            INSERT INTO manuscripts_fts (title, abstract, authors, keywords)
-            VALUES (?, ?, ?, ?)
-        """, rows)
+        print("Re-indexing manuscripts into FTS table...")
+        # Reads every row of the content table and indexes it under its pk
+        cursor.execute("INSERT INTO manuscripts_fts(manuscripts_fts) VALUES('rebuild')")
 
         conn.commit()
-        print(f"✅ Rebuilt FTS index with {len(rows)} rows.")
+        cursor.execute("SELECT COUNT(*) FROM manuscripts")
+        print(f"✅ Rebuilt FTS index with {cursor.fetchone()[0]} rows.")
 
 if __name__ == "__main__":
     rebuild_fts()
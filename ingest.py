@@ -0,0 +1,78 @@
+"""
+Bulk write path for the manuscripts table, shared by every harvester.
+
+Papers are de-duplicated in memory, written with one executemany of
+INSERT OR IGNORE, and the FTS index is then filled in a single statement from
+the rows that received new rowids. Duplicates (cross-listings, re-runs) cost a
+unique-index probe instead of a raised and caught IntegrityError per paper.
+"""
+import json
+import sqlite3
+import unicodedata
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",      # readers (website, summary.py) don't block the writer
+    "PRAGMA synchronous=NORMAL",    # safe with WAL; fsync per checkpoint, not per commit
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",     # 64 MiB page cache
+    "PRAGMA busy_timeout=30000",
+)
+
+INSERT_SQL = """
+INSERT OR IGNORE INTO manuscripts (
+    id, title, authors, authors_display, orcids, keywords, abstract,
+    link, published_timestamp, added_timestamp
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# New rows always get rowids above the previous maximum, so this picks up exactly
+# the rows inserted by the executemany before it.
+INDEX_NEW_ROWS_SQL = """
+INSERT INTO manuscripts_fts (rowid, title, abstract, authors, keywords)
+SELECT rowid, title, abstract, authors, keywords FROM manuscripts WHERE rowid > ?
+"""
+
+def display_authors(authors):
+    """The JSON author list as stored -> 'A. One, B. Two', NFC-normalized, for e-mails."""
+    try:
+        names = json.loads(authors)
+    except (TypeError, ValueError):
+        names = authors or ""
+    if isinstance(names, list):
+        names = ", ".join(str(name) for name in names)
+    return unicodedata.normalize("NFC", str(names).strip())
+
+def connect(db_path):
+    conn = sqlite3.connect(db_path)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+def insert_papers(conn, papers):
+    """
+    Insert paper dicts (as built by the harvesters) and index them for FTS.
+    Returns the number of new manuscripts. Does not commit, so callers can make
+    other writes part of the same transaction.
+    """
+    unique = {}
+    for paper in papers:
+        unique.setdefault(paper["id"], paper)
+    if not unique:
+        return 0
+
+    cursor = conn.cursor()
+    # Take the write lock before reading the high-water mark: another writer
+    # committing in between would otherwise have its rows indexed twice below.
+    # A caller that already wrote in this transaction holds the lock anyway.
+    if not conn.in_transaction:
+        cursor.execute("BEGIN IMMEDIATE")
+    cursor.execute("SELECT COALESCE(MAX(rowid), 0) FROM manuscripts")
+    before = cursor.fetchone()[0]
+
+    cursor.executemany(INSERT_SQL, (
+        (p["id"], p["title"], p["authors"], display_authors(p["authors"]), p["orcids"],
+         p["keywords"], p["abstract"], p["link"], p["published_timestamp"], p["added_timestamp"])
+        for p in unique.values()
+    ))
+    cursor.execute(INDEX_NEW_ROWS_SQL, (before,))
+    return cursor.rowcount
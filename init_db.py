@@ -10,22 +10,25 @@ def init_db():
         # Create main manuscripts table
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS manuscripts (
-                id TEXT PRIMARY KEY,
+                pk INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT NOT NULL UNIQUE,
                 title TEXT,
                 authors TEXT,
+                authors_display TEXT,
                 orcids TEXT,
                 keywords TEXT,
                 abstract TEXT,
                 link TEXT,
                 published_timestamp TEXT,
-                added_timestamp TEXT
+                added_timestamp TEXT,
+                summary TEXT DEFAULT ''
             )
         """)
 
         # Create FTS5 table for full-text search
         cursor.execute("""
-            CREATE VIRTUAL TABLE IF NOT EXISTS fts_manuscripts
-            USING fts5(title, abstract, keywords, authors, content='manuscripts', content_rowid='id');
+            CREATE VIRTUAL TABLE IF NOT EXISTS manuscripts_fts
+            USING fts5(title, abstract, authors, keywords, content='manuscripts', content_rowid='pk');
         """)
 
         conn.commit()
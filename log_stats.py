@@ -3,6 +3,8 @@ import sqlite3
 from datetime import datetime, timezone
 from glob import glob
 
+import match_store
+
 print('')
 print(datetime.now(timezone.utc).isoformat())
 
@@ -41,17 +43,15 @@ def collect_stats():
         filter_files = glob(os.path.join(user_dir, "filter_*.json"))
         num_filters += len(filter_files)
 
-        # Count entries in matches.db
-        user_db_path = os.path.join(user_dir, "matches.db")
-        if os.path.exists(user_db_path):
-            try:
-                with sqlite3.connect(user_db_path) as user_conn:
-                    cursor = user_conn.cursor()
-                    cursor.execute("SELECT COUNT(*) FROM manuscripts")
-                    count = cursor.fetchone()[0]
-                    num_recommendations += count
-            except Exception as e:
-                print(f"⚠️ Error reading {user_db_path}: {e}")
+    # Count recommended papers per user in the shared match table
+    try:
+        with match_store.connect() as conn:
+            match_store.ensure_schema(conn)
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM (SELECT DISTINCT user_id, manuscript_pk FROM matches)")
+            num_recommendations = cursor.fetchone()[0]
+    except Exception as e:
+        print(f"⚠️ Error reading matches: {e}")
 
     return num_users, num_filters, num_recommendations
 
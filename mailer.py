@@ -0,0 +1,139 @@
+"""
+SMTP delivery for notifier.py.
+
+Instead of connecting, STARTTLS-ing and logging in once per recipient, a small
+pool of threads each keeps one authenticated connection and sends many
+messages over it. A connection is recycled after MESSAGES_PER_CONNECTION
+messages (Gmail limits messages per session), and dropped and reopened when it
+fails. Transient errors (4xx replies, network errors) are retried with backoff;
+5xx replies are final.
+
+SMTP_SERVER/SMTP_PORT/SMTP_STARTTLS can point at a local sink for testing.
+"""
+import os
+import time
+import random
+import smtplib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+
+SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") == "1"
+SMTP_CONNECTIONS = int(os.getenv("SMTP_CONNECTIONS", "3"))
+MESSAGES_PER_CONNECTION = 90
+SMTP_TIMEOUT = 60
+SEND_RETRIES = 4
+RETRY_BACKOFF = 2.0  # seconds before the first retry, doubled each time
+
+def build_message(sender, to_email, subject, plain_body, html_body):
+    msg = MIMEMultipart("alternative")
+    msg["From"] = sender
+    msg["To"] = to_email
+    msg["Subject"] = subject
+
+    msg.attach(MIMEText(plain_body, "plain", "utf-8"))
+    msg.attach(MIMEText(html_body, "html", "utf-8"))
+    return msg
+
+def is_permanent(error):
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    code = getattr(error, "smtp_code", None)
+    return isinstance(code, int) and code >= 500
+
+class SMTPPool:
+    """Up to `size` authenticated SMTP connections, one per sending thread."""
+
+    def __init__(self, user, password, size=SMTP_CONNECTIONS,
+                 host=SMTP_SERVER, port=SMTP_PORT, starttls=SMTP_STARTTLS):
+        self.user = user
+        self.password = password
+        self.size = size
+        self.host = host
+        self.port = port
+        self.starttls = starttls
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._open = set()
+        self._executor = None
+        self.connects = 0
+
+    def _connection(self):
+        server = getattr(self._local, "server", None)
+        if server is None:
+            server = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+            try:
+                if self.starttls:
+                    server.starttls()
+                if self.password:
+                    server.login(self.user, self.password)
+            except Exception:
+                server.close()
+                raise
+            self._local.server = server
+            self._local.sent = 0
+            with self._lock:
+                self._open.add(server)
+                self.connects += 1
+        return server
+
+    def _drop(self, polite=False):
+        server = getattr(self._local, "server", None)
+        if server is None:
+            return
+        self._local.server = None
+        with self._lock:
+            self._open.discard(server)
+        try:
+            server.quit() if polite else server.close()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+    def send(self, msg):
+        """Send one message on this thread's connection, reconnecting and retrying as needed."""
+        for attempt in range(1, SEND_RETRIES + 1):
+            try:
+                self._connection().send_message(msg)
+                self._local.sent += 1
+                if self._local.sent >= MESSAGES_PER_CONNECTION:
+                    self._drop(polite=True)
+                return
+            except (smtplib.SMTPException, OSError) as e:
+                # The session state is unknown after any error; start over on a fresh one
+                self._drop()
+                if attempt == SEND_RETRIES or is_permanent(e):
+                    raise
+                time.sleep(RETRY_BACKOFF * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+
+    def send_all(self, messages):
+        """
+        Send (key, message) pairs concurrently. Yields (key, None) for each delivered
+        message and (key, exception) for each that failed, in completion order.
+        The sending threads outlive the call, so later batches reuse their connections.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.size)
+        futures = {self._executor.submit(self.send, msg): key for key, msg in messages}
+        for future in as_completed(futures):
+            yield futures[future], future.exception()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        with self._lock:
+            servers, self._open = list(self._open), set()
+        for server in servers:
+            try:
+                server.quit()
+            except (smtplib.SMTPException, OSError):
+                server.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,103 @@
+"""
+Shared store for filter matches, kept in the main database next to the corpus.
+
+One row per (user, filter, manuscript) referencing manuscripts.pk, instead of a
+full copy of every matched paper in each user's own matches.db. Titles,
+abstracts and summaries are read through a join, so a summary written after
+matching shows up in the next e-mail without any copying.
+
+User ids are the suffix of the user directory name (data/users/user_<id>), the
+same id notifier.py looks up in users.db. migrate_matches.py imports the old
+per-user files.
+"""
+import os
+import sqlite3
+
+import ingest
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+MAIN_DB_PATH = os.path.join(SCRIPT_DIR, "data", "manuscript_db.db")
+
+CREATE_MATCHES_SQL = """
+CREATE TABLE IF NOT EXISTS matches (
+    user_id TEXT NOT NULL,
+    filter TEXT NOT NULL,
+    manuscript_pk INTEGER NOT NULL,
+    label TEXT NOT NULL CHECK(label IN ('new', 'old')),
+    matched_at TEXT NOT NULL,
+    notified_at TEXT,
+    coverage REAL,
+    PRIMARY KEY (user_id, filter, manuscript_pk)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_matches_user_label ON matches(user_id, label);
+CREATE INDEX IF NOT EXISTS idx_matches_manuscript ON matches(manuscript_pk);
+"""
+
+# Relevance of a match, added after the table: the share of the filter's phrases
+# found in the paper, as the sweep computes it. NULL for matches stored before scoring.
+SCORE_COLUMNS = (("coverage", "REAL"),)
+
+# A paper the user was already e-mailed about stays 'old' when another of their
+# filters matches it later, as it did with the single row per paper in matches.db
+INSERT_MATCH_SQL = """
+INSERT OR IGNORE INTO matches (user_id, filter, manuscript_pk, label, matched_at, coverage)
+VALUES (:user_id, :filter, :pk,
+        CASE WHEN EXISTS (SELECT 1 FROM matches
+                          WHERE user_id = :user_id AND manuscript_pk = :pk AND label = 'old')
+             THEN 'old' ELSE 'new' END,
+        :matched_at, :coverage)
+"""
+
+SELECT_MATCHES_SQL = """
+SELECT mt.filter, mt.label, mt.matched_at, mt.coverage,
+       m.pk, m.id, m.title, m.authors, m.authors_display, m.abstract,
+       m.link, m.summary, m.published_timestamp, m.added_timestamp
+FROM matches AS mt
+JOIN manuscripts AS m ON m.pk = mt.manuscript_pk
+WHERE mt.user_id = ? {label_clause}
+ORDER BY m.published_timestamp DESC, m.pk DESC, mt.filter
+"""
+
+def connect(db_path=MAIN_DB_PATH):
+    conn = ingest.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def ensure_schema(conn):
+    conn.executescript(CREATE_MATCHES_SQL)
+    existing = [row[1] for row in conn.execute("PRAGMA table_info(matches)")]
+    for column, kind in SCORE_COLUMNS:
+        if column not in existing:
+            conn.execute(f"ALTER TABLE matches ADD COLUMN {column} {kind}")
+
+def user_id_for(user_dir):
+    """'.../data/users/user_42' -> '42'"""
+    return os.path.basename(os.path.normpath(user_dir))[len("user_"):]
+
+def store_matches(conn, user_id, matches, matched_at):
+    """
+    Record (filter name, manuscript pk[, coverage]) tuples for a user.
+    Returns how many were new. Does not commit.
+    """
+    cur = conn.executemany(INSERT_MATCH_SQL, (
+        {"user_id": user_id, "filter": filter_name, "pk": pk, "matched_at": matched_at,
+         "coverage": coverage}
+        for filter_name, pk, coverage in ((*m, None)[:3] for m in matches)
+    ))
+    return cur.rowcount
+
+def fetch_matches(conn, user_id, label=None):
+    """A user's matches joined with the manuscripts, newest papers first; one row per filter."""
+    sql = SELECT_MATCHES_SQL.format(label_clause="AND mt.label = ?" if label else "")
+    return conn.execute(sql, (user_id, label) if label else (user_id,)).fetchall()
+
+def mark_notified(conn, user_id, notified_at, manuscript_pks):
+    """Flip a user's 'new' matches of these manuscripts to 'old'. Does not commit."""
+    conn.executemany("""
+        UPDATE matches SET label = 'old', notified_at = ?
+        WHERE user_id = ? AND manuscript_pk = ? AND label = 'new'
+    """, ((notified_at, user_id, pk) for pk in manuscript_pks))
+
+def prune_orphans(conn):
+    """Drop matches whose manuscript has been pruned from the corpus. Does not commit."""
+    return conn.execute("DELETE FROM matches WHERE manuscript_pk NOT IN (SELECT pk FROM manuscripts)").rowcount
@@ -0,0 +1,158 @@
+"""
+Single-pass keyword matching for all user filters at once.
+
+Every filter is a list of keyword groups, ANDed together, each group being an OR
+of quoted phrases (see build_fts_query_from_filter). Instead of one FTS MATCH per
+filter, all phrases of all filters go into one PhraseIndex and every manuscript is
+tokenized once and checked against the whole index.
+
+Tokenization is that of the default FTS5 'unicode61' tokenizer, so a filter
+matches the same papers as its MATCH query. ASCII is simple (letters and digits
+are token characters, A-Z folds to a-z). Beyond ASCII, unicode61 folds each
+code point through its own table: case, final sigma, and the diacritic of a
+Latin letter carrying exactly one ("Nguyễn" keeps its ễ, "H₂O" its ₂). Rather
+than reimplement that table, each non-ASCII character is looked up once in
+SQLite itself and the answer cached.
+"""
+import re
+import sqlite3
+import threading
+
+# Columns indexed by manuscripts_fts; a phrase has to match inside one column.
+MATCH_COLUMNS = ("title", "abstract", "authors", "keywords")
+
+_TOKEN = re.compile(r"[^\W_]+")
+
+class _Unicode61Fold(dict):
+    """str.translate table: code point -> its unicode61 fold, "" if dropped, " " if a separator."""
+
+    def __init__(self):
+        super().__init__((c, chr(c).lower() if chr(c).isalnum() else " ") for c in range(128))
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def __missing__(self, code):
+        with self._lock:
+            if self._conn is None:
+                self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+                self._conn.execute("CREATE VIRTUAL TABLE t USING fts5(x)")
+                self._conn.execute("CREATE VIRTUAL TABLE v USING fts5vocab(t, 'instance')")
+            # Between two ASCII letters: one token "a?b" unless the character separates
+            try:
+                with self._conn:
+                    self._conn.execute("DELETE FROM t")
+                    self._conn.execute("INSERT INTO t (rowid, x) VALUES (1, ?)", ("a" + chr(code) + "b",))
+                terms = [row[0] for row in self._conn.execute("SELECT term FROM v ORDER BY offset")]
+            except (sqlite3.Error, UnicodeEncodeError):  # lone surrogates
+                terms = []
+            fold = terms[0][1:-1] if len(terms) == 1 else " "
+            self[code] = fold
+            return fold
+
+_FOLD = _Unicode61Fold()
+
+def tokenize(text):
+    if not text:
+        return []
+    if text.isascii():
+        return _TOKEN.findall(text.lower())
+    return text.translate(_FOLD).split()
+
+def parse_keyword(keyword):
+    """'"quantum dots"' -> ('quantum', 'dots'); quotes are FTS syntax, not content."""
+    return tuple(tokenize(keyword.strip().strip('"')))
+
+class PhraseIndex:
+    """Shared phrase index over the keyword groups of many filters."""
+
+    def __init__(self):
+        self._phrase_ids = {}   # token tuple -> phrase id
+        self._by_first = {}     # first token -> [(phrase id, token tuple)]
+        self._filters = []      # [(key, [[phrase id, ...], ...])]
+        self._by_phrase = {}    # phrase id -> [filter index]; only first-group phrases
+
+    def __len__(self):
+        return len(self._filters)
+
+    @property
+    def phrase_count(self):
+        return len(self._phrase_ids)
+
+    def _phrase_id(self, tokens):
+        pid = self._phrase_ids.get(tokens)
+        if pid is None:
+            pid = len(self._phrase_ids)
+            self._phrase_ids[tokens] = pid
+            self._by_first.setdefault(tokens[0], []).append((pid, tokens))
+        return pid
+
+    def add_filter(self, key, keyword_groups):
+        """Register a filter under `key`. Returns False if it has nothing to match on."""
+        groups = []
+        for group in keyword_groups:
+            phrases = [parse_keyword(kw) for kw in group]
+            pids = sorted({self._phrase_id(p) for p in phrases if p})
+            if not pids:
+                # An empty group can never be satisfied, like an empty FTS phrase.
+                return False
+            groups.append(pids)
+        if not groups:
+            return False
+
+        idx = len(self._filters)
+        self._filters.append((key, groups))
+        # Every hit has to satisfy the first group, so that is enough to find candidates.
+        for pid in groups[0]:
+            self._by_phrase.setdefault(pid, []).append(idx)
+        return True
+
+    def phrases_in(self, texts):
+        """Return the ids of all indexed phrases occurring in any of `texts`."""
+        hits = set()
+        by_first = self._by_first
+        for text in texts:
+            tokens = tokenize(text)
+            n = len(tokens)
+            for i, tok in enumerate(tokens):
+                candidates = by_first.get(tok)
+                if not candidates:
+                    continue
+                for pid, phrase in candidates:
+                    if pid in hits:
+                        continue
+                    end = i + len(phrase)
+                    if end <= n and tuple(tokens[i:end]) == phrase:
+                        hits.add(pid)
+        return hits
+
+    def _matching(self, hits):
+        """(key, groups) of every filter satisfied by the phrase ids in `hits`."""
+        candidates = set()
+        for pid in hits:
+            candidates.update(self._by_phrase.get(pid, ()))
+
+        for idx in sorted(candidates):
+            key, groups = self._filters[idx]
+            if all(any(pid in hits for pid in group) for group in groups):
+                yield key, groups
+
+    def match(self, texts):
+        """Return the keys of all filters matching a document given as column texts."""
+        hits = self.phrases_in(texts)
+        if not hits:
+            return []
+        return [key for key, _ in self._matching(hits)]
+
+    def match_coverage(self, texts):
+        """
+        Like match, but returns (key, coverage) pairs, coverage being the share of
+        the filter's phrases (over all its groups) that occur in the document.
+        """
+        hits = self.phrases_in(texts)
+        if not hits:
+            return []
+        matched = []
+        for key, groups in self._matching(hits):
+            found = sum(pid in hits for group in groups for pid in group)
+            matched.append((key, found / sum(len(group) for group in groups)))
+        return matched
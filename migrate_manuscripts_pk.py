@@ -0,0 +1,83 @@
+"""
+One time use script to give the manuscripts table an INTEGER PRIMARY KEY
+AUTOINCREMENT (`pk`) and rebuild manuscripts_fts as an external-content index
+keyed on it. Existing rowids (or pks, for tables that already have the column
+without AUTOINCREMENT) are copied into `pk`, so filter watermarks stay valid.
+
+AUTOINCREMENT never hands out a pk again once its row is pruned, so the sequence
+is started above every pk still referenced: the corpus, stored matches and the
+filters' last_rowid watermarks.
+"""
+import os
+import sqlite3
+from glob import glob
+
+from daily_update import CREATE_TABLE_SQL, CREATE_FTS_SQL, CREATE_INDEX_SQL
+from filtering import USERS_ROOT, load_filters
+
+DB_PATH = os.path.join(os.path.dirname(__file__), "data", "manuscript_db.db")
+
+COLUMNS = [
+    "id", "title", "authors", "authors_display", "orcids", "keywords", "abstract",
+    "link", "published_timestamp", "added_timestamp", "summary",
+]
+
+def highest_watermark():
+    filters = load_filters(sorted(glob(os.path.join(USERS_ROOT, "user_*"))))
+    marks = [f["data"].get("last_rowid") for f in filters]
+    return max((m for m in marks if isinstance(m, int)), default=0)
+
+def migrate():
+    with sqlite3.connect(DB_PATH) as conn:
+        conn.isolation_level = None  # DDL below must share one transaction
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'manuscripts'")
+        if "AUTOINCREMENT" in cursor.fetchone()[0].upper():
+            print("Table already has 'pk INTEGER PRIMARY KEY AUTOINCREMENT'.")
+            return
+
+        cursor.execute("PRAGMA table_info(manuscripts)")
+        existing = [row[1] for row in cursor.fetchall()]
+        key = "pk" if "pk" in existing else "rowid"
+        copied = [c for c in COLUMNS if c in existing]
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'matches'")
+        has_matches = cursor.fetchone() is not None
+
+        cursor.execute("BEGIN")
+        try:
+            cursor.execute("DROP TABLE IF EXISTS manuscripts_fts")
+            cursor.execute("ALTER TABLE manuscripts RENAME TO manuscripts_old")
+            cursor.execute(CREATE_TABLE_SQL)
+            cursor.execute(f"""
+                INSERT INTO manuscripts (pk, {", ".join(copied)})
+                SELECT {key}, {", ".join(copied)} FROM manuscripts_old
+            """)
+            cursor.execute("DROP TABLE manuscripts_old")
+
+            high = highest_watermark()
+            if has_matches:
+                cursor.execute("SELECT COALESCE(MAX(manuscript_pk), 0) FROM matches")
+                high = max(high, cursor.fetchone()[0])
+            # The copy above already moved the sequence to MAX(pk); only ever raise it
+            cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'manuscripts'")
+            if high > cursor.fetchone()[0]:
+                cursor.execute("DELETE FROM sqlite_sequence WHERE name = 'manuscripts'")
+                cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('manuscripts', ?)", (high,))
+
+            cursor.execute(CREATE_INDEX_SQL)
+            cursor.execute(CREATE_FTS_SQL)
+            cursor.execute("INSERT INTO manuscripts_fts(manuscripts_fts) VALUES('rebuild')")
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+
+        cursor.execute("SELECT COUNT(*) FROM manuscripts")
+        count = cursor.fetchone()[0]
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'manuscripts'")
+        row = cursor.fetchone()
+        print(f"✅ Migrated {count} manuscripts; FTS rebuilt on 'pk', next pk above {row[0] if row else 0}.")
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,60 @@
+"""
+One time use script to move every data/users/user_*/matches.db into the shared
+`matches` table of the main database (see match_store.py).
+
+Each copied row becomes a (user, source_filter, manuscript pk) match with its
+label preserved; papers already pruned from the corpus are skipped. Re-running
+is harmless. The old files are left in place and can be deleted afterwards.
+"""
+import os
+import sqlite3
+from glob import glob
+
+import match_store
+
+USERS_ROOT = os.path.join(match_store.SCRIPT_DIR, "data", "users")
+
+MIGRATE_SQL = """
+INSERT OR IGNORE INTO matches (user_id, filter, manuscript_pk, label, matched_at)
+SELECT ?, COALESCE(NULLIF(u.source_filter, ''), 'unknown'), m.pk, u.label, u.added_timestamp
+FROM user_db.manuscripts AS u
+JOIN manuscripts AS m ON m.id = u.id
+"""
+
+COUNT_PRUNED_SQL = """
+SELECT COUNT(*) FROM user_db.manuscripts AS u
+WHERE NOT EXISTS (SELECT 1 FROM manuscripts AS m WHERE m.id = u.id)
+"""
+
+def migrate():
+    with match_store.connect() as conn:
+        conn.isolation_level = None  # one transaction around the ATTACHed copies
+        match_store.ensure_schema(conn)
+        user_dbs = sorted(glob(os.path.join(USERS_ROOT, "user_*", "matches.db")))
+        total = skipped = 0
+
+        for db_path in user_dbs:
+            user_id = match_store.user_id_for(os.path.dirname(db_path))
+            conn.execute("ATTACH DATABASE ? AS user_db", (db_path,))
+            try:
+                conn.execute("BEGIN")
+                added = conn.execute(MIGRATE_SQL, (user_id,)).rowcount
+                gone = conn.execute(COUNT_PRUNED_SQL).fetchone()[0]
+                conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                print(f"❌ {db_path}: {e}")
+                continue
+            finally:
+                conn.execute("DETACH DATABASE user_db")
+            total += added
+            skipped += gone
+            print(f"→ user {user_id}: {added} match(es) added, {gone} pruned paper(s) skipped")
+
+    print(f"✅ Migrated {total} match(es) from {len(user_dbs)} user database(s); "
+          f"{skipped} row(s) referred to papers no longer in the corpus.")
+    print("The old matches.db files are no longer read and can be deleted.")
+
+if __name__ == "__main__":
+    migrate()
@@ -1,26 +1,28 @@
 import os
-import smtplib
+import sys
 import sqlite3
 import json
 import re
 import unicodedata
 import codecs
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import heapq
 from datetime import datetime, timezone
+from functools import lru_cache
 from dotenv import load_dotenv
 
+import match_store
+import outbox
+from mailer import SMTPPool, build_message
+
 # --- Configuration ---
 DEBUG = False
 DEBUG_SAMPLE_USER_ID = "1"
 DEBUG_SAMPLE_LIMIT = 4
+TOP_K_PER_FILTER = 10  # papers listed per filter; the rest are only counted
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-BASE_DIR = os.path.join(SCRIPT_DIR, "data", "users")
 USERS_DB = os.path.join(SCRIPT_DIR, "data", "users.db")
 TRANSLATION_PATH = os.path.join(SCRIPT_DIR, "website", "translation.json")
-SMTP_SERVER = "smtp.gmail.com"
-SMTP_PORT = 587
 
 load_dotenv()
 EMAIL_FROM = os.getenv("GMAIL_ADRESS")
@@ -79,206 +81,161 @@ def get_users():
             users[str(uid)] = {"email": email, "lang": (lang or "en")}
     return users
 
-def _matches_db_path(user_id):
-    return os.path.join(BASE_DIR, f"user_{user_id}", "matches.db")
-
-def get_new_matches_grouped(user_id):
-    """Return grouped NEW matches with authors and summary included."""
-    db_path = _matches_db_path(user_id)
-    if not os.path.isfile(db_path):
-        return {}
-
-    with sqlite3.connect(db_path) as conn:
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM manuscripts WHERE label = 'new'")
-        rows = cursor.fetchall()
+def _relevance(row):
+    """Sort key of a match, most relevant first: the share of the filter's phrases it contains."""
+    return -(row["coverage"] or 0)
 
-    grouped = {}
+def _group_by_paper(rows, limit=None, top_k=None):
+    """
+    One entry per paper, carrying every one of the user's filters that matched it.
+    Papers hit by more filters come first (most relevant, then newest, among
+    equals) and are grouped under their combination of filters, e.g. "quantum + ML".
+    Rows must come ordered by paper, as match_store.fetch_matches returns them.
+
+    With `top_k`, only each filter's top_k most relevant papers are listed; a paper
+    stays if any of its filters ranks it that high. Returns (grouped, hidden), where
+    hidden maps a filter to the pks of its papers that were left out; those stay
+    'new' and compete again in the next digest.
+    """
+    papers = {}
+    by_filter = {}
     for row in rows:
-        source_filter = row["source_filter"] if "source_filter" in row.keys() else "unknown"
-        authors = fix_unicode_leaks(row["authors"] if "authors" in row.keys() else "")
-        grouped.setdefault(source_filter, []).append({
-            "title": row["title"],
-            "link": row["link"],
-            "authors": authors,
-            "summary": row["summary"] if "summary" in row.keys() else "",
-            "abstract": row["abstract"]
-        })
-    return grouped
-
-def get_recent_any_label_grouped(user_id, limit=4):
-    """Fetch up to `limit` most recent entries (any label), grouped by source_filter, including authors and summary."""
-    db_path = _matches_db_path(user_id)
-    if not os.path.isfile(db_path):
-        return {}
-
-    with sqlite3.connect(db_path) as conn:
-        conn.row_factory = sqlite3.Row
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT
-                title,
-                link,
-                CASE WHEN EXISTS (SELECT 1 FROM pragma_table_info('manuscripts') WHERE name='authors')
-                     THEN authors ELSE '' END AS authors,
-                CASE WHEN EXISTS (SELECT 1 FROM pragma_table_info('manuscripts') WHERE name='summary')
-                     THEN summary ELSE '' END AS summary,
-                CASE WHEN EXISTS (SELECT 1 FROM pragma_table_info('manuscripts') WHERE name='source_filter')
-                     THEN source_filter ELSE 'unknown' END AS source_filter,
-                CASE WHEN EXISTS (SELECT 1 FROM pragma_table_info('manuscripts') WHERE name='published_timestamp')
-                     THEN published_timestamp ELSE NULL END AS published_timestamp,
-                CASE WHEN EXISTS (SELECT 1 FROM pragma_table_info('manuscripts') WHERE name='added_timestamp')
-                     THEN added_timestamp ELSE NULL END AS added_timestamp,
-                abstract,
-                rowid
-            FROM manuscripts
-            ORDER BY
-              CASE WHEN published_timestamp IS NOT NULL THEN datetime(published_timestamp) END DESC,
-              CASE WHEN added_timestamp IS NOT NULL THEN datetime(added_timestamp) END DESC,
-              rowid DESC
-            LIMIT ?
-        """, (limit,))
-        rows = cur.fetchall()
+        entry = papers.get(row["pk"])
+        if entry is None:
+            if limit is not None and len(papers) >= limit:
+                break
+            entry = papers[row["pk"]] = {
+                "title": row["title"],
+                "link": row["link"],
+                "authors": row["authors_display"] or fix_unicode_leaks(row["authors"] or ""),
+                "summary": row["summary"] or "",
+                "abstract": row["abstract"],
+                "pk": row["pk"],
+                "filters": [],
+                "rank": _relevance(row),
+            }
+        name = row["filter"] or "unknown"
+        rank = _relevance(row)
+        entry["filters"].append(name)
+        entry["rank"] = min(entry["rank"], rank)
+        # Newer papers (higher pk) win ties, e.g. between matches stored before scoring
+        by_filter.setdefault(name, []).append((rank, -row["pk"]))
+
+    hidden = {}
+    if top_k is not None:
+        shown = set()
+        for matched in by_filter.values():
+            shown.update(-neg_pk for _, neg_pk in heapq.nsmallest(top_k, matched))
+        for name, matched in by_filter.items():
+            left_out = [-neg_pk for _, neg_pk in matched if -neg_pk not in shown]
+            if left_out:
+                hidden[name] = left_out
+        papers = {pk: entry for pk, entry in papers.items() if pk in shown}
 
     grouped = {}
-    for row in rows:
-        sf = row["source_filter"] if row["source_filter"] else "unknown"
-        authors = fix_unicode_leaks(row["authors"] or "")
-        grouped.setdefault(sf, []).append({
-            "title": row["title"],
-            "link": row["link"],
-            "authors": authors,
-            "summary": row["summary"] or "",
-            "abstract": row["abstract"]
-        })
-    return grouped
-
-def mark_all_old(user_id):
-    if DEBUG:  # don't touch labels during debug dry-runs
-        return
-    db_path = _matches_db_path(user_id)
-    if not os.path.isfile(db_path):
-        return
-    with sqlite3.connect(db_path) as conn:
-        conn.execute("UPDATE manuscripts SET label = 'old' WHERE label = 'new'")
-        conn.commit()
+    for entry in sorted(papers.values(), key=lambda e: (-len(e["filters"]), e["rank"])):
+        grouped.setdefault(" + ".join(entry["filters"]), []).append(entry)
+    return grouped, hidden
 
-# --- Email formatting ---
-def format_email_plain(grouped, lang):
-    total = sum(len(v) for v in grouped.values())
-    lines = []
-    # Intro + link
-    lines.append(f"{t('email.manage_filters', lang)} https://arxivbutler.com/\n")
-    lines.append(t("email.intro", lang))
-    lines.append("")
-    # Summary
-    lines.append(f"{t('email.found_matches', lang).format(count=total)}")
-    if total > 10:
-        lines.append(t("email.too_many_matches", lang))
-    lines.append("")
-    # Body
-    for filter_name, matches in grouped.items():
-        lines.append(f"{t('email.filter_name', lang)}: {filter_name}")
-        for m in matches:
-            lines.append(f"• {m['title']}")
-            lines.append(m['link'])
-            if m.get("authors"):
-                lines.append(f"Authors: {m['authors']}")
-            if m.get("summary"):
-                lines.append(f"Novelty in topics: {m['summary']}")
-            if total <= 10 and m.get("abstract"):
-                lines.append(m["abstract"])
-            lines.append("")
-        lines.append("")
-    # Disclaimer
-    lines.append(t("email.disclaimer", lang))
-    return "\n".join(lines)
+def get_new_matches_grouped(user_id):
+    """
+    Return NEW matches, one entry per paper, grouped by the filters that hit it and
+    cut to TOP_K_PER_FILTER per filter. Returns (grouped, hidden) as _group_by_paper.
+    """
+    with match_store.connect() as conn:
+        rows = match_store.fetch_matches(conn, user_id, label="new")
+    return _group_by_paper(rows, top_k=TOP_K_PER_FILTER)
 
-def format_email_html(grouped, lang):
-    total = sum(len(v) for v in grouped.values())
-    manage_link = "https://arxivbutler.com/"
+def get_recent_any_label_grouped(user_id, limit=4):
+    """Fetch up to `limit` most recent papers (any label), grouped like get_new_matches_grouped."""
+    with match_store.connect() as conn:
+        rows = match_store.fetch_matches(conn, user_id)
+    return _group_by_paper(rows, limit)[0]
 
-    intro_html = f"""
+# --- Email formatting ---
+# Digests are assembled from pieces rendered ahead of time: the language-dependent
+# frame is compiled once per language, and each paper's block is rendered once per
+# run and reused for every recipient it matched (see _paper_fragments).
+MANAGE_LINK = "https://arxivbutler.com/"
+ABSTRACTS_MAX = 10  # above this many matches, abstracts are left out
+_SLOT = "\x00"      # where per-digest content goes in a compiled frame
+
+HTML_INTRO = """
       <p style="margin:0 0 12px 0; line-height:1.5; color:#4C191B;">
-        {t('email.intro', lang)}
+        {intro}
       </p>
       <p style="margin:0 0 16px 0; line-height:1.5;">
         <a href="{manage_link}" style="color:#05668D; text-decoration:none; font-weight:600;">
-          {t('email.manage_filters', lang)}
+          {manage_filters}
         </a>
       </p>
     """
 
-    summary_html = f"""
+HTML_SUMMARY = """
       <p style="margin:0 0 12px 0; font-weight:600; color:#4C191B;">
-        {t('email.found_matches', lang).format(count=total)}
+        {found}
       </p>
-      {('<p style="margin:0 0 12px 0; color:#BE6E46;">' + t('email.too_many_matches', lang) + '</p>') if total > 10 else ''}
+      {too_many}
     """
 
-    sections = []
-    for filter_name, matches in grouped.items():
-        items = []
-        for m in matches:
-            authors_block = ""
-            if m.get("authors"):
-                authors_block = f"""
+HTML_AUTHORS = """
                   <div style="font-size:13px; color:#333; margin-top:2px;">
-                    {_escape_html(m['authors'])}
+                    {authors}
                   </div>
-                """.strip()
+                """
 
-            novelty_block = ""
-            if m.get("summary"):
-                novelty_block = f"""
+HTML_NOVELTY = """
                   <div style="margin-top:6px; font-size:13px; color:#4C191B; line-height:1.45;">
-                    <strong>Novelty in topics:</strong> {_escape_html(m['summary'])}
+                    <strong>Novelty in topics:</strong> {summary}
                   </div>
-                """.strip()
+                """
 
-            abstract_block = ""
-            if total <= 10 and m.get("abstract"):
-                abstract_block = f"""
+HTML_ABSTRACT = """
                   <div style="margin-top:8px; font-size:13px; color:#4C191B; line-height:1.45;">
-                    {_escape_html(m['abstract'])}
+                    {abstract}
                   </div>
-                """.strip()
+                """
 
-            # Title is the ONLY link now (no extra URL block below).
-            items.append(f"""
+# Title is the ONLY link now (no extra URL block below).
+HTML_ITEM = """
               <tr>
                 <td style="padding:12px 16px; border:1px solid rgba(76,25,27,0.2);">
                   <div style="font-size:15px; font-weight:600; margin-bottom:4px; line-height:1.35;">
-                    <a href="{m['link']}" style="color:#05668D; text-decoration:none;">{_escape_html(m['title'])}</a>
+                    <a href="{link}" style="color:#05668D; text-decoration:none;">{title}</a>
                   </div>
                   {authors_block}
                   {novelty_block}
                   {abstract_block}
                 </td>
               </tr>
-            """)
-        section_html = f"""
+            """
+
+HTML_SECTION = """
           <tr>
             <td style="padding-top:6px; padding-bottom:6px;">
               <div style="font-weight:700; margin:14px 0 8px 0; font-size:16px; color:#4C191B;">
-                {t('email.filter_name', lang)}: {_escape_html(filter_name)}
+                {filter_label}: {filter_name}
               </div>
               <table role="presentation" width="100%" cellspacing="0" cellpadding="0" style="border-collapse:collapse;">
-                {''.join(items)}
+                {items}
               </table>
             </td>
           </tr>
         """
-        sections.append(section_html)
 
-    disclaimer_html = f"""
+HTML_MORE = """
+      <p style="margin:12px 0 0 0; font-size:13px; color:#4C191B; line-height:1.5;">
+        {text}
+      </p>
+    """
+
+HTML_DISCLAIMER = """
       <p style="margin:18px 0 0 0; font-size:12px; color:#4C191B; line-height:1.5;">
-        {t('email.disclaimer', lang)}
+        {disclaimer}
       </p>
     """
 
-    outer = f"""
+HTML_OUTER = """
     <html>
       <body style="margin:0; padding:0; background:#FFEECF;">
         <table role="presentation" width="100%" cellspacing="0" cellpadding="0" style="background:#FFEECF; padding:16px 0;">
@@ -287,22 +244,23 @@ def format_email_html(grouped, lang):
               <table role="presentation" width="96%" style="max-width:700px; background:#ffffff; border:1px solid rgba(76,25,27,0.2); border-radius:8px; overflow:hidden;" cellpadding="0" cellspacing="0">
                 <tr>
                   <td style="padding:16px 20px; background:#BE6E46; color:#fff; font-weight:700; font-size:18px;">
-                    {t('email.subject', lang)}
+                    {subject}
                   </td>
                 </tr>
                 <tr>
                   <td style="padding:18px 20px;">
-                    {intro_html}
-                    {summary_html}
+                    {intro}
+                    {summary}
                     <table role="presentation" width="100%" cellspacing="0" cellpadding="0" style="border-collapse:collapse; margin-top:6px;">
-                      {''.join(sections)}
+                      {sections}
                     </table>
-                    {disclaimer_html}
+                    {more}
+                    {disclaimer}
                   </td>
                 </tr>
               </table>
               <div style="color:#4C191B; font-size:11px; margin-top:10px;">
-                © {datetime.now().year} ArXiv Butler
+                © {year} ArXiv Butler
               </div>
             </td>
           </tr>
@@ -310,66 +268,203 @@ def format_email_html(grouped, lang):
       </body>
     </html>
     """
-    return outer
 
-# --- Email sending ---
-def send_email(to_email, subject, plain_body, html_body):
-    msg = MIMEMultipart("alternative")
-    msg["From"] = EMAIL_FROM
-    msg["To"] = to_email
-    msg["Subject"] = subject
+@lru_cache(maxsize=None)
+def compile_templates(lang, year):
+    """Render everything in a digest that depends only on the language (and year)."""
+    html_head, html_mid, html_more, html_tail = HTML_OUTER.format(
+        subject=t("email.subject", lang),
+        intro=HTML_INTRO.format(intro=t("email.intro", lang), manage_link=MANAGE_LINK,
+                                manage_filters=t("email.manage_filters", lang)),
+        summary=_SLOT,
+        sections=_SLOT,
+        more=_SLOT,
+        disclaimer=HTML_DISCLAIMER.format(disclaimer=t("email.disclaimer", lang)),
+        year=year,
+    ).split(_SLOT)
+    section_open, section_mid, section_close = HTML_SECTION.format(
+        filter_label=t("email.filter_name", lang), filter_name=_SLOT, items=_SLOT,
+    ).split(_SLOT)
+    too_many = t("email.too_many_matches", lang)
+    return {
+        "found": t("email.found_matches", lang),
+        "more": t("email.more_matches", lang),
+        "plain_head": f"{t('email.manage_filters', lang)} {MANAGE_LINK}\n\n{t('email.intro', lang)}\n",
+        "plain_too_many": too_many,
+        "plain_filter": f"{t('email.filter_name', lang)}: ",
+        "plain_tail": t("email.disclaimer", lang),
+        "html_head": html_head,
+        "html_mid": html_mid,
+        "html_more": html_more,
+        "html_tail": html_tail,
+        "html_too_many": '<p style="margin:0 0 12px 0; color:#BE6E46;">' + too_many + '</p>',
+        "html_section_open": section_open,
+        "html_section_mid": section_mid,
+        "html_section_close": section_close,
+    }
+
+# (pk, with_abstract) -> (plain, html); paper blocks carry no per-user or
+# per-language text, so one rendering serves every recipient. Cleared per run.
+_FRAGMENTS = {}
+
+def clear_fragment_cache():
+    _FRAGMENTS.clear()
+
+def _render_paper(m, with_abstract):
+    plain = [f"• {m['title']}", m["link"]]
+    authors_block = novelty_block = abstract_block = ""
+    if m.get("authors"):
+        plain.append(f"Authors: {m['authors']}")
+        authors_block = HTML_AUTHORS.format(authors=_escape_html(m["authors"])).strip()
+    if m.get("summary"):
+        plain.append(f"Novelty in topics: {m['summary']}")
+        novelty_block = HTML_NOVELTY.format(summary=_escape_html(m["summary"])).strip()
+    if with_abstract and m.get("abstract"):
+        plain.append(m["abstract"])
+        abstract_block = HTML_ABSTRACT.format(abstract=_escape_html(m["abstract"])).strip()
+    plain.append("")
+    html = HTML_ITEM.format(link=m["link"], title=_escape_html(m["title"]), authors_block=authors_block,
+                            novelty_block=novelty_block, abstract_block=abstract_block)
+    return "\n".join(plain), html
+
+def _paper_fragments(m, with_abstract):
+    if m.get("pk") is None:
+        return _render_paper(m, with_abstract)
+    key = (m["pk"], with_abstract)
+    fragments = _FRAGMENTS.get(key)
+    if fragments is None:
+        fragments = _FRAGMENTS[key] = _render_paper(m, with_abstract)
+    return fragments
+
+def _more_lines(hidden, tpl):
+    """'N more matches for filter X follow next time' for each filter cut by TOP_K_PER_FILTER."""
+    return [tpl["more"].format(count=len(pks), filter=name) for name, pks in hidden.items()]
+
+def format_email_plain(grouped, lang, hidden=None):
+    hidden = hidden or {}
+    tpl = compile_templates(lang, datetime.now().year)
+    shown = sum(len(v) for v in grouped.values())
+    total = shown + len({pk for pks in hidden.values() for pk in pks})
+    with_abstract = shown <= ABSTRACTS_MAX
+    lines = [tpl["plain_head"], tpl["found"].format(count=total)]
+    if not with_abstract:
+        lines.append(tpl["plain_too_many"])
+    lines.append("")
+    for filter_name, matches in grouped.items():
+        lines.append(tpl["plain_filter"] + filter_name)
+        lines.extend(_paper_fragments(m, with_abstract)[0] for m in matches)
+        lines.append("")
+    if hidden:
+        lines.extend(_more_lines(hidden, tpl))
+        lines.append("")
+    lines.append(tpl["plain_tail"])
+    return "\n".join(lines)
 
-    msg.attach(MIMEText(plain_body, "plain", "utf-8"))
-    msg.attach(MIMEText(html_body, "html", "utf-8"))
+def format_email_html(grouped, lang, hidden=None):
+    hidden = hidden or {}
+    tpl = compile_templates(lang, datetime.now().year)
+    shown = sum(len(v) for v in grouped.values())
+    total = shown + len({pk for pks in hidden.values() for pk in pks})
+    with_abstract = shown <= ABSTRACTS_MAX
+    summary = HTML_SUMMARY.format(found=tpl["found"].format(count=total),
+                                  too_many="" if with_abstract else tpl["html_too_many"])
+    parts = [tpl["html_head"], summary, tpl["html_mid"]]
+    for filter_name, matches in grouped.items():
+        parts.append(tpl["html_section_open"])
+        parts.append(_escape_html(filter_name))
+        parts.append(tpl["html_section_mid"])
+        parts.extend(_paper_fragments(m, with_abstract)[1] for m in matches)
+        parts.append(tpl["html_section_close"])
+    parts.append(tpl["html_more"])
+    for text in _more_lines(hidden, tpl):
+        parts.append(HTML_MORE.format(text=_escape_html(text)))
+    parts.append(tpl["html_tail"])
+    return "".join(parts)
 
-    with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-        server.starttls()
-        server.login(EMAIL_FROM, EMAIL_PASSWORD)
-        server.send_message(msg)
 
 # --- Main flow ---
-def main():
+def render_digest(info, grouped, hidden=None):
+    lang = info["lang"]
+    subject = t("email.subject", lang)
+    return subject, format_email_plain(grouped, lang, hidden), format_email_html(grouped, lang, hidden)
+
+def render(users):
+    """Queue one digest per user with new matches. Returns how many were queued."""
+    queued = 0
+    clear_fragment_cache()
+    with match_store.connect() as conn:
+        outbox.ensure_schema(conn)
+        for user_id, info in users.items():
+            grouped, hidden = get_new_matches_grouped(user_id)
+            if not grouped:
+                print(f"ℹ️  No matches for {info['email']}")
+                continue
+            subject, plain, html = render_digest(info, grouped, hidden)
+            # Only listed papers are notified; the ones cut stay 'new' for the next digest
+            pks = {m["pk"] for items in grouped.values() for m in items}
+            outbox.enqueue(conn, user_id, info["email"], subject, plain, html, pks)
+            queued += 1
+    print(f"📝 Queued {queued} digest(s).")
+    return queued
+
+def send():
+    """Deliver everything pending in the outbox."""
+    with match_store.connect() as conn:
+        outbox.ensure_schema(conn)
+        with SMTPPool(EMAIL_FROM, EMAIL_PASSWORD) as pool:
+            # Claim a few messages per connection at a time; a message that fails
+            # goes back to pending and waits for the next run, not the next batch
+            claimed = outbox.claim(conn, limit=pool.size * outbox.CLAIM_BATCH)
+            while claimed:
+                messages = ((row["id"], outbox.to_message(row, EMAIL_FROM)) for row in claimed)
+                recipients = {row["id"]: row["recipient"] for row in claimed}
+                for outbox_id, error in pool.send_all(messages):
+                    status = outbox.record_result(conn, outbox_id, error)
+                    if error:
+                        print(f"❌ Failed to send to {recipients[outbox_id]} ({status}): {error}")
+                    else:
+                        print(f"✅ Email sent to {recipients[outbox_id]}")
+                claimed = outbox.claim(conn, limit=pool.size * outbox.CLAIM_BATCH,
+                                       after=claimed[-1]["id"])
+        outbox.purge_sent(conn)
+        print(f"📨 Outbox: {outbox.counts(conn)}")
+
+def send_debug_sample(users):
+    """Send a sample of recent matches (any label) without queueing or touching labels."""
+    if DEBUG_SAMPLE_USER_ID not in users:
+        print(f"❌ DEBUG: user id {DEBUG_SAMPLE_USER_ID} not found in users.db")
+        return
+    info = users[DEBUG_SAMPLE_USER_ID]
+    grouped = get_recent_any_label_grouped(DEBUG_SAMPLE_USER_ID, limit=DEBUG_SAMPLE_LIMIT)
+    if not grouped:
+        print(f"ℹ️  No matches for {info['email']}")
+        return
+    subject, plain, html = render_digest(info, grouped)
+    print(f"--- EMAIL (PLAIN) to {info['email']} ---\n{plain}\n--- END PLAIN ---\n")
+    print(f"--- EMAIL (HTML) to {info['email']} ---\n{html}\n--- END HTML ---\n")
+    with SMTPPool(EMAIL_FROM, EMAIL_PASSWORD, size=1) as pool:
+        for _, error in pool.send_all([(DEBUG_SAMPLE_USER_ID, build_message(EMAIL_FROM, info["email"], subject, plain, html))]):
+            if error:
+                print(f"❌ DEBUG email to {info['email']} failed: {error}")
+            else:
+                print(f"✅ DEBUG email sent to {info['email']} (max {DEBUG_SAMPLE_LIMIT} entries, any label)")
+
+def main(step="all"):
+    """step: 'render' queues digests, 'send' drains the outbox, 'all' does both."""
     print("📬 Notifier running...")
     if not EMAIL_FROM or not EMAIL_PASSWORD:
         print("❌ Missing email credentials.")
         return
 
-    users = get_users()
-
     if DEBUG:
-        if DEBUG_SAMPLE_USER_ID not in users:
-            print(f"❌ DEBUG: user id {DEBUG_SAMPLE_USER_ID} not found in users.db")
-            return
-        users = {DEBUG_SAMPLE_USER_ID: users[DEBUG_SAMPLE_USER_ID]}
-
-    for user_id, info in users.items():
-        email = info["email"]
-        lang = info["lang"]
-
-        if DEBUG:
-            grouped = get_recent_any_label_grouped(user_id, limit=DEBUG_SAMPLE_LIMIT)
-        else:
-            grouped = get_new_matches_grouped(user_id)
-
-        if not grouped:
-            print(f"ℹ️  No matches for {email}")
-            continue
-
-        subject = t("email.subject", lang)
-        plain = format_email_plain(grouped, lang)
-        html = format_email_html(grouped, lang)
-
-        if DEBUG:
-            print(f"--- EMAIL (PLAIN) to {email} ---\n{plain}\n--- END PLAIN ---\n")
-            print(f"--- EMAIL (HTML) to {email} ---\n{html}\n--- END HTML ---\n")
-            send_email(email, subject, plain, html)
-            print(f"✅ DEBUG email sent to {email} (max {DEBUG_SAMPLE_LIMIT} entries, any label)")
-        else:
-            send_email(email, subject, plain, html)
-            mark_all_old(user_id)
-            print(f"✅ Email sent to {email}")
+        send_debug_sample(get_users())
+        return
+    if step in ("render", "all"):
+        render(get_users())
+    if step in ("send", "all"):
+        send()
 
 if __name__ == "__main__":
     print('')
     print(datetime.now(timezone.utc).isoformat())
-    main()
+    main(sys.argv[1] if len(sys.argv) > 1 else "all")
@@ -0,0 +1,150 @@
+"""
+Bulk ingest through arXiv's OAI-PMH interface instead of per-category search.
+
+One ListRecords sweep (metadataPrefix=arXivRaw, from/until datestamps, following
+resumption tokens) returns every changed paper exactly once, however many
+categories it is cross-listed in. Records are mapped onto the same `manuscripts`
+rows that daily_update.py produces and inserted page by page.
+
+    python oai_harvest.py                      # since the last successful run
+    python oai_harvest.py 2025-10-01 [2025-10-03]
+
+OAI_URL can point at a local stand-in server for testing.
+"""
+import os
+import sys
+import json
+import re
+import sqlite3
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlencode
+
+from arxiv_client import fetch
+from daily_update import CREATE_STATE_SQL, DB_PATH, N_DAYS, initialize_database, insert_papers_to_db
+
+OAI_URL = os.getenv("OAI_URL", "http://export.arxiv.org/oai2")
+METADATA_PREFIX = "arXivRaw"
+STATE_KEY = "oai:last_until"
+
+NS = {
+    "oai": "http://www.openarchives.org/OAI/2.0/",
+    "raw": "http://arxiv.org/OAI/arXivRaw/",
+}
+
+_WHITESPACE = re.compile(r"\s+")
+_AUTHOR_SPLIT = re.compile(r",\s*(?:and\s+)?|\s+and\s+")
+
+def _clean(text):
+    return _WHITESPACE.sub(" ", text or "").strip()
+
+def split_authors(authors):
+    """'A. One, B. Two and C. Three' -> ['A. One', 'B. Two', 'C. Three']"""
+    return [a for a in (_clean(part) for part in _AUTHOR_SPLIT.split(_clean(authors))) if a]
+
+def record_to_paper(record, cutoff, added_timestamp):
+    """Map one OAI <record> onto a manuscripts row dict, or None to skip it."""
+    header = record.find("oai:header", NS)
+    if header is None or header.get("status") == "deleted":
+        return None
+    meta = record.find("oai:metadata/raw:arXivRaw", NS)
+    if meta is None:
+        return None
+
+    versions = meta.findall("raw:version", NS)
+    if not versions:
+        return None
+    # The search API reports the first submission as 'published' and the latest
+    # version in the id; mirror that so both ingest paths produce the same rows.
+    published_dt = parsedate_to_datetime(versions[0].findtext("raw:date", "", NS)).astimezone(timezone.utc)
+    if published_dt < cutoff:
+        return None
+    arxiv_id = meta.findtext("raw:id", "", NS).strip() + versions[-1].get("version", "v1")
+
+    return {
+        "id": arxiv_id,
+        "title": _clean(meta.findtext("raw:title", "", NS)),
+        "authors": json.dumps(split_authors(meta.findtext("raw:authors", "", NS))),
+        "orcids": json.dumps([]),
+        "keywords": json.dumps(meta.findtext("raw:categories", "", NS).split()),
+        "abstract": _clean(meta.findtext("raw:abstract", "", NS)),
+        "link": f"http://arxiv.org/abs/{arxiv_id}",
+        "published_timestamp": published_dt.isoformat(),
+        "added_timestamp": added_timestamp,
+    }
+
+def list_records(from_date, until_date):
+    """Yield one list of <record> elements per ListRecords response page."""
+    params = {"verb": "ListRecords", "metadataPrefix": METADATA_PREFIX,
+              "from": from_date, "until": until_date}
+    while True:
+        # Resumption tokens are single-use, so these pages are never re-read from a cache
+        root = ET.fromstring(fetch(f"{OAI_URL}?{urlencode(params)}", ttl=None))
+
+        error = root.find("oai:error", NS)
+        if error is not None:
+            if error.get("code") == "noRecordsMatch":
+                return
+            raise RuntimeError(f"OAI-PMH error {error.get('code')}: {_clean(error.text)}")
+
+        listing = root.find("oai:ListRecords", NS)
+        if listing is None:
+            return
+        yield listing.findall("oai:record", NS)
+
+        token = listing.find("oai:resumptionToken", NS)
+        if token is None or not (token.text or "").strip():
+            return
+        # Follow-up requests carry only the verb and the token
+        params = {"verb": "ListRecords", "resumptionToken": token.text.strip()}
+        print(f"Resuming (cursor {token.get('cursor', '?')} of {token.get('completeListSize', '?')}) ...")
+
+def get_state(key):
+    with sqlite3.connect(DB_PATH) as conn:
+        conn.execute(CREATE_STATE_SQL)
+        row = conn.execute("SELECT value FROM harvest_state WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+def set_state(key, value):
+    with sqlite3.connect(DB_PATH) as conn:
+        conn.execute(CREATE_STATE_SQL)
+        conn.execute("INSERT OR REPLACE INTO harvest_state (key, value) VALUES (?, ?)", (key, value))
+        conn.commit()
+
+def harvest(from_date, until_date, cutoff):
+    """Ingest everything changed in [from_date, until_date] first submitted after `cutoff`."""
+    added_timestamp = datetime.now(timezone.utc).isoformat()
+    total = 0
+    print(f"OAI-PMH ListRecords {from_date} → {until_date} from {OAI_URL}")
+    for records in list_records(from_date, until_date):
+        papers = [p for p in (record_to_paper(r, cutoff, added_timestamp) for r in records) if p]
+        print(f"Page: {len(records)} record(s) → Keeping {len(papers)}")
+        insert_papers_to_db(papers)
+        total += len(papers)
+    return total
+
+if __name__ == "__main__":
+    print('')
+    print(datetime.now(timezone.utc).isoformat())
+    initialize_database()
+
+    today = datetime.now(timezone.utc).date()
+    cutoff = datetime.now(timezone.utc) - timedelta(days=N_DAYS)
+    if len(sys.argv) > 1:
+        from_date = sys.argv[1]
+        # An explicit range is a backfill: keep everything first submitted in it
+        cutoff = datetime.strptime(from_date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    else:
+        # Overlap by a day; re-seen papers are dropped as duplicates on insert
+        last = get_state(STATE_KEY)
+        start = datetime.strptime(last, "%Y-%m-%d").date() - timedelta(days=1) if last else today - timedelta(days=N_DAYS)
+        from_date = start.isoformat()
+    until_date = sys.argv[2] if len(sys.argv) > 2 else today.isoformat()
+
+    total = harvest(from_date, until_date, cutoff)
+    # A backfill of an old range must not move the incremental start back
+    last = get_state(STATE_KEY)
+    if not last or until_date > last:
+        set_state(STATE_KEY, until_date)
+    print(f"\n✅ Done. Total manuscripts kept from OAI-PMH: {total}")
@@ -0,0 +1,111 @@
+"""
+Durable outbox for notification e-mails, in the main database.
+
+notifier.py renders each digest into an outbox row and, in the same
+transaction, flips the matches it contains to 'old'; a crash before the commit
+leaves nothing queued and the matches still 'new', a crash after it leaves a
+pending message. The sender claims rows (pending -> sending) and records each
+outcome (sent, back to pending with the error, or failed after MAX_ATTEMPTS), so
+a rerun only sends what is still pending.
+
+A row left in 'sending' by a crashed sender is claimed again after
+STALE_CLAIM, so delivery is at-least-once; the Message-ID is fixed per row,
+letting mail clients drop the rare duplicate. Claims are conditional updates,
+so several senders can drain the same outbox. The sender claims CLAIM_BATCH
+messages per connection at a time, so a claim is sent well before it goes stale
+and a second sender only waits on the batch in flight, not the whole backlog.
+"""
+from datetime import datetime, timedelta, timezone
+from email.utils import make_msgid
+
+import match_store
+from mailer import build_message, is_permanent
+
+MAX_ATTEMPTS = 5
+CLAIM_BATCH = 20  # messages claimed per SMTP connection at a time
+STALE_CLAIM = timedelta(minutes=30)
+KEEP_SENT = timedelta(days=30)
+
+CREATE_OUTBOX_SQL = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    body_plain TEXT NOT NULL,
+    body_html TEXT NOT NULL,
+    message_id TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending' CHECK(status IN ('pending', 'sending', 'sent', 'failed')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    claimed_at TEXT,
+    sent_at TEXT,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_status ON outbox(status, id);
+"""
+
+CLAIMABLE = "(status = 'pending' OR (status = 'sending' AND claimed_at < :stale))"
+
+def _now():
+    return datetime.now(timezone.utc)
+
+def ensure_schema(conn):
+    conn.executescript(CREATE_OUTBOX_SQL)
+
+def enqueue(conn, user_id, recipient, subject, plain, html, manuscript_pks):
+    """Queue one digest and mark the matches it covers as notified, atomically."""
+    now = _now().isoformat()
+    with conn:
+        conn.execute("""
+            INSERT INTO outbox (user_id, recipient, subject, body_plain, body_html, message_id, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (user_id, recipient, subject, plain, html, make_msgid(domain="arxivbutler.com"), now))
+        match_store.mark_notified(conn, user_id, now, manuscript_pks)
+
+def claim(conn, limit=None, after=0):
+    """Move up to `limit` claimable messages with id > `after` to 'sending' and return them."""
+    now = _now()
+    params = {"stale": (now - STALE_CLAIM).isoformat(), "now": now.isoformat(),
+              "limit": limit or -1, "after": after}
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = conn.execute(f"""
+            SELECT * FROM outbox WHERE {CLAIMABLE} AND id > :after ORDER BY id LIMIT :limit
+        """, params).fetchall()
+        conn.executemany(f"""
+            UPDATE outbox SET status = 'sending', claimed_at = :now, attempts = attempts + 1
+            WHERE id = :id AND {CLAIMABLE}
+        """, ({**params, "id": row["id"]} for row in rows))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return rows
+
+def to_message(row, sender):
+    msg = build_message(sender, row["recipient"], row["subject"], row["body_plain"], row["body_html"])
+    msg["Message-ID"] = row["message_id"]
+    return msg
+
+def record_result(conn, outbox_id, error=None):
+    """Store a delivery outcome. Returns the row's new status."""
+    now = _now().isoformat()
+    with conn:
+        if error is None:
+            conn.execute("UPDATE outbox SET status = 'sent', sent_at = ?, last_error = NULL WHERE id = ?",
+                         (now, outbox_id))
+            return "sent"
+        attempts = conn.execute("SELECT attempts FROM outbox WHERE id = ?", (outbox_id,)).fetchone()[0]
+        status = "failed" if is_permanent(error) or attempts >= MAX_ATTEMPTS else "pending"
+        conn.execute("UPDATE outbox SET status = ?, last_error = ? WHERE id = ?",
+                     (status, str(error)[:500], outbox_id))
+        return status
+
+def counts(conn):
+    return dict(conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status"))
+
+def purge_sent(conn, keep=KEEP_SENT):
+    with conn:
+        return conn.execute("DELETE FROM outbox WHERE status = 'sent' AND sent_at < ?",
+                            ((_now() - keep).isoformat(),)).rowcount
@@ -1,9 +1,20 @@
 import os
 import re
+import json
 import time
+import random
+import hashlib
+import threading
+import unicodedata
 import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timezone
+
 import requests
 
+import match_store
+
 DB_PATH = "data/manuscript_db.db"
 OLLAMA_URL = os.getenv("OLLAMA_URL", "http://127.0.0.1:11434")
 
@@ -15,6 +26,7 @@ def clean(text: str) -> str:
     tail = text.split("</think>")[-1]
     return REASONING.sub("", tail).strip() or text.strip()
 
+MODEL = "gemma3:1b"
 BASE_OPTIONS = {"temperature": 0.2, "top_p": 0.9, "num_predict": 100, "num_ctx": 1024, "seed": 42}
 
 SYSTEM_LIST = (
@@ -23,7 +35,72 @@ SYSTEM_LIST = (
   "Third-person; no background/applications/future work; preserve numerics; no <think>."
 )
 
-def summarize_novelty_list(abstract: str, model: str = "gemma3:1b") -> str:
+# Shared by all workers, so calls reuse keep-alive connections to Ollama
+SESSION = requests.Session()
+
+# ---- Streaming ----
+# Single-abstract calls stream Ollama's NDJSON output. Think-blocks are dropped
+# as they arrive and the response is closed as soon as the answer line ends,
+# which makes Ollama stop generating instead of spending the rest of num_predict.
+def visible_answer(raw: str) -> str:
+    """The answer part of a partial response: closed think-blocks removed, an open one cut off."""
+    text = REASONING.sub("", raw)
+    open_at = text.lower().find("<think>")
+    return text if open_at == -1 else text[:open_at]
+
+class CallStats:
+    """Per-call latency numbers, collected from all worker threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = []  # (time to first token, tokens/s, cut off early)
+
+    def record(self, ttft, tps, cut):
+        with self._lock:
+            self.calls.append((ttft, tps, cut))
+
+    def report(self):
+        with self._lock:
+            calls = list(self.calls)
+        if not calls:
+            return "no streamed calls"
+        ttfts = sorted(c[0] for c in calls)
+        p50 = ttfts[len(ttfts) // 2]
+        p95 = ttfts[min(len(ttfts) - 1, int(len(ttfts) * 0.95))]
+        tps = sum(c[1] for c in calls) / len(calls)
+        cut = sum(c[2] for c in calls)
+        return f"calls={len(calls)}, ttft p50={p50:.2f}s p95={p95:.2f}s, {tps:.1f} tok/s, cut early={cut}"
+
+STATS = CallStats()
+
+def _stream_answer(response, field, start) -> str:
+    first = None
+    tokens = 0
+    raw = ""
+    cut = False
+    with response:
+        for line in response.iter_lines():
+            if not line:
+                continue
+            data = json.loads(line)
+            piece = field(data)
+            if piece:
+                tokens += 1
+                if first is None:
+                    first = time.perf_counter()
+                raw += piece
+                answer = visible_answer(raw).lstrip()
+                if "\n" in answer:
+                    raw, cut = answer.split("\n", 1)[0], True
+                    break
+            if data.get("done"):
+                break
+    end = time.perf_counter()
+    if first is not None:
+        STATS.record(first - start, tokens / max(end - first, 1e-9), cut)
+    return clean(raw)
+
+def summarize_novelty_list(abstract: str, model: str = MODEL) -> str:
     payload = {
         "model": model,
         "messages": [
@@ -31,104 +108,342 @@ def summarize_novelty_list(abstract: str, model: str = "gemma3:1b") -> str:
             {"role": "user", "content": f"Abstract:\n{abstract}\n"},
         ],
         "options": BASE_OPTIONS,
-        "stream": False,
+        "stream": True,
         "keep_alive": "1h",
     }
-    r = requests.post(f"{OLLAMA_URL}/api/chat", json=payload, timeout=60)
+    start = time.perf_counter()
+    r = SESSION.post(f"{OLLAMA_URL}/api/chat", json=payload, timeout=60, stream=True)
+    field = lambda data: (data.get("message", {}) or {}).get("content")
     if r.status_code == 404:
-        r = requests.post(
+        r.close()
+        r = SESSION.post(
             f"{OLLAMA_URL}/api/generate",
             json={
                 "model": model,
                 "prompt": SYSTEM_LIST + "\n\nAbstract:\n" + abstract,
                 "options": BASE_OPTIONS,
-                "stream": False,
+                "stream": True,
                 "keep_alive": "1h",
             },
             timeout=60,
+            stream=True,
         )
+        field = lambda data: data.get("response")
+    if not r.ok:
+        r.close()
+    r.raise_for_status()
+    return _stream_answer(r, field, start)
+
+# ---- Batched prompting ----
+# Several abstracts per request: the system prompt, request setup and model
+# warm-up are paid once per batch instead of once per abstract. The model answers
+# with one JSON object keyed by the [n] labels; anything missing or malformed is
+# redone with a single-abstract call.
+PROMPT_BATCH = int(os.getenv("SUMMARY_PROMPT_BATCH", "1"))
+
+SYSTEM_BATCH = (
+  "You are a scientific assistant. For each numbered research abstract, extract only its novel contributions "
+  "as a single line of comma-separated short noun phrases (3–8 words). "
+  "Third-person; no background/applications/future work; preserve numerics; no <think>. "
+  'Answer with one JSON object mapping each abstract number to its line, e.g. {"1": "...", "2": "..."}.'
+)
+
+def batch_options(n):
+    # Room for every abstract in the prompt and every answer in the output
+    return {**BASE_OPTIONS, "num_predict": BASE_OPTIONS["num_predict"] * n,
+            "num_ctx": max(BASE_OPTIONS["num_ctx"], 512 + 384 * n)}
+
+def parse_batch_answer(text: str, n: int) -> dict:
+    """Map 1-based labels to cleaned one-line answers; drops anything unusable."""
+    try:
+        data = json.loads(clean(text))
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    answers = {}
+    for label, value in data.items():
+        label = str(label).strip("[] ")
+        if label.isdigit() and 1 <= int(label) <= n and isinstance(value, str):
+            line = " ".join(value.split())
+            if line:
+                answers[int(label)] = line
+    return answers
+
+def summarize_novelty_batch(abstracts: list, model: str = MODEL) -> dict:
+    """Summarize several abstracts in one call. Returns {index: summary} for those that parsed."""
+    numbered = "\n\n".join(f"[{i}] {abstract}" for i, abstract in enumerate(abstracts, 1))
+    payload = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": SYSTEM_BATCH},
+            {"role": "user", "content": f"Abstracts:\n{numbered}\n"},
+        ],
+        "options": batch_options(len(abstracts)),
+        "format": "json",
+        "stream": False,
+        "keep_alive": "1h",
+    }
+    r = SESSION.post(f"{OLLAMA_URL}/api/chat", json=payload, timeout=60 + 30 * len(abstracts))
     r.raise_for_status()
     data = r.json()
     text = (data.get("message", {}) or {}).get("content") or data.get("response", "")
-    return clean(text)
+    return {i - 1: line for i, line in parse_batch_answer(text, len(abstracts)).items()}
+
+# ---- Summary cache ----
+# Summaries keyed by what produced them: normalized abstract, model, prompt and
+# options. A re-ingested or replaced paper with an unchanged abstract is served
+# from here, and changing the prompt or model only misses on the new keys.
+CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", "200000"))
+
+CREATE_CACHE_SQL = """
+CREATE TABLE IF NOT EXISTS summary_cache (
+    key TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    last_used TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_summary_cache_last_used ON summary_cache(last_used);
+"""
+
+def normalize_abstract(abstract: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", abstract).split())
+
+def cache_key(abstract: str, model: str = MODEL, prompt: str = SYSTEM_LIST) -> str:
+    material = json.dumps([normalize_abstract(abstract), model, prompt, BASE_OPTIONS], sort_keys=True)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+class SummaryCache:
+    """Lookups against the summary_cache table, with hit/miss counters for the run."""
+
+    def __init__(self, conn, max_entries=CACHE_MAX_ENTRIES):
+        self.conn = conn
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        conn.executescript(CREATE_CACHE_SQL)
+
+    def get(self, key):
+        row = self.conn.execute("SELECT summary FROM summary_cache WHERE key = ?", (key,)).fetchone()
+        if row:
+            self.hits += 1
+            return row[0]
+        self.misses += 1
+        return None
+
+    def evict(self):
+        """Drop the least recently used entries beyond max_entries. Returns how many."""
+        with self.conn:
+            cur = self.conn.execute("""
+                DELETE FROM summary_cache WHERE key IN (
+                    SELECT key FROM summary_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+        return cur.rowcount
+
+# ---- Retry ----
+REQUEST_RETRIES = 3
+RETRY_BACKOFF = 2.0  # seconds before the first retry, doubled each time
+
+def _retryable(e):
+    # Timeouts, refused connections, overload; a 4xx other than 429 won't get better
+    if isinstance(e, requests.HTTPError) and e.response is not None:
+        return e.response.status_code == 429 or e.response.status_code >= 500
+    return isinstance(e, requests.RequestException)
+
+def with_retry(fn, *args):
+    for attempt in range(1, REQUEST_RETRIES + 1):
+        try:
+            return fn(*args)
+        except Exception as e:
+            if attempt == REQUEST_RETRIES or not _retryable(e):
+                raise
+            time.sleep(RETRY_BACKOFF * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+
+def summarize_group(items, prompt):
+    """
+    Summarize [(id, abstract), ...] in one batched call where possible, falling
+    back to single calls for ids the batch didn't answer. Returns
+    ({id: (summary, cache key)}, {id: error}). Every summary is keyed on the run's
+    `prompt`, fallbacks included, so the next run with that prompt finds it.
+    """
+    done, errors = {}, {}
+    if len(items) > 1:
+        try:
+            answers = with_retry(summarize_novelty_batch, [abstract for _, abstract in items])
+        except Exception as e:
+            print(f"[batch-fail] {len(items)} abstracts :: {e}; falling back to single calls")
+            answers = {}
+        for i, (mid, abstract) in enumerate(items):
+            if i in answers:
+                done[mid] = (answers[i], cache_key(abstract, prompt=prompt))
+    for mid, abstract in items:
+        if mid in done:
+            continue
+        try:
+            done[mid] = (with_retry(summarize_novelty_list, abstract), cache_key(abstract, prompt=prompt))
+        except Exception as e:
+            errors[mid] = e
+    return done, errors
 
 # ---- Main worker ----
-MAX_SECONDS = 3 * 60 * 60  # 5 hours
+MAX_SECONDS = 3 * 60 * 60  # 3 hours
 BATCH_SIZE = 50            # number of rows to pull per DB fetch
+# Requests kept in flight against Ollama; the server needs OLLAMA_NUM_PARALLEL >= this
+# to actually run them side by side
+WORKERS = int(os.getenv("SUMMARY_WORKERS", "4"))
+COMMIT_EVERY = 20          # summaries written per transaction
 
-SELECT_BATCH_SQL = """
-SELECT id, abstract
+# Skip papers no filter matched (SUMMARY_ONLY_MATCHED=1 or --only-matched)
+ONLY_MATCHED = os.getenv("SUMMARY_ONLY_MATCHED", "0") == "1"
+
+SELECT_PENDING_SQL = """
+SELECT rowid, id
 FROM manuscripts
 WHERE (summary IS NULL OR TRIM(summary) = '')
   AND abstract IS NOT NULL AND TRIM(abstract) <> ''
   AND added_timestamp >= datetime('now', '-24 hours')
-ORDER BY added_timestamp ASC
-LIMIT ?;
+ORDER BY rowid ASC;
 """
 
+SELECT_ABSTRACTS_SQL = "SELECT rowid, id, abstract FROM manuscripts WHERE rowid IN ({})"
+
 UPDATE_SQL = "UPDATE manuscripts SET summary = ? WHERE id = ?;"
 
-def fill_summaries():
+# Stores new summaries and refreshes last_used on hits
+CACHE_UPSERT_SQL = """
+INSERT INTO summary_cache (key, summary, last_used) VALUES (?, ?, ?)
+ON CONFLICT(key) DO UPDATE SET summary = excluded.summary, last_used = excluded.last_used;
+"""
+
+# ---- Scheduling ----
+def load_demand(conn):
+    """Number of users holding each manuscript (by rowid) as a 'new', not yet e-mailed, match."""
+    match_store.ensure_schema(conn)
+    return dict(conn.execute("""
+        SELECT manuscript_pk, COUNT(DISTINCT user_id) FROM matches
+        WHERE label = 'new' GROUP BY manuscript_pk
+    """))
+
+def schedule(conn, demand, only_matched=ONLY_MATCHED):
+    """
+    Yield pending (rowid, id, abstract) rows, the most subscribed papers first and
+    otherwise in insertion order. Abstracts are loaded BATCH_SIZE rows at a time.
+    """
+    pending = conn.execute(SELECT_PENDING_SQL).fetchall()
+    order = sorted(pending, key=lambda row: (-demand.get(row[0], 0), row[0]))
+    matched = sum(1 for rowid, _ in pending if rowid in demand)
+    if only_matched:
+        order = order[:matched]
+    print(f"[schedule] pending={len(pending)}, matched={matched}, queued={len(order)}")
+
+    for i in range(0, len(order), BATCH_SIZE):
+        chunk = [rowid for rowid, _ in order[i:i + BATCH_SIZE]]
+        rows = {row[0]: row for row in conn.execute(
+            SELECT_ABSTRACTS_SQL.format(",".join("?" * len(chunk))), chunk)}
+        for rowid in chunk:
+            if rowid in rows:
+                yield rows[rowid]
+
+def write_summaries(conn, results):
+    """Commit (summary, id, cache key) results to manuscripts and the cache together."""
+    if results:
+        now = datetime.now(timezone.utc).isoformat()
+        with conn:
+            conn.executemany(UPDATE_SQL, ((summary, mid) for summary, mid, _ in results))
+            conn.executemany(CACHE_UPSERT_SQL, ((key, summary, now) for summary, _, key in results))
+        results.clear()
+
+def fill_summaries(workers=WORKERS, prompt_batch=PROMPT_BATCH, only_matched=ONLY_MATCHED):
+    """
+    Summarize pending abstracts with `workers` Ollama requests in flight, each
+    carrying up to `prompt_batch` abstracts. Papers waiting in the most users'
+    matches go first, so they are ready before the notifier runs. Only this thread touches the
+    database: results are collected as requests finish and committed in batches
+    of COMMIT_EVERY. Abstracts already in the summary cache never reach the pool.
+    """
     start = time.time()
     processed = 0
     failures = 0
+    results = []       # (summary, id, cache key) waiting to be committed
+    group = []         # cache misses waiting to fill a prompt batch
+    pending = {}       # future -> number of abstracts in it
+    exhausted = False
+    # One cache key space per run: the prompt this run summarizes with
+    prompt = SYSTEM_BATCH if prompt_batch > 1 else SYSTEM_LIST
 
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.isolation_level = None  # we'll control transactions manually
-        cur = conn.cursor()
-
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute("PRAGMA busy_timeout=30000")
+    cache = SummaryCache(conn)
+    rows = schedule(conn, load_demand(conn), only_matched)
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
         while True:
-            # Respect 5-hour wall clock limit
-            if time.time() - start >= MAX_SECONDS:
-                print("[stop] Reached 5-hour limit.")
-                break
+            if not exhausted and time.time() - start >= MAX_SECONDS:
+                print("[stop] Reached time limit; finishing requests in flight.")
+                exhausted = True
+
+            # Back-pressure: at most 2x workers requests handed to the pool
+            while not exhausted and len(pending) < workers * 2:
+                row = next(rows, None)
+                if row is None:
+                    print("[done] No more items to process (within 24h window & empty summaries).")
+                    exhausted = True
+                    break
+                _, mid, abstract = row
+                key = cache_key(abstract, prompt=prompt)
+                cached = cache.get(key)
+                if cached:
+                    results.append((cached, mid, key))
+                    processed += 1
+                    continue
+                group.append((mid, abstract))
+                if len(group) >= prompt_batch:
+                    pending[pool.submit(summarize_group, group, prompt)] = len(group)
+                    group = []
+            if exhausted and group:
+                pending[pool.submit(summarize_group, group, prompt)] = len(group)
+                group = []
 
-            cur.execute(SELECT_BATCH_SQL, (BATCH_SIZE,))
-            rows = cur.fetchall()
-            if not rows:
-                print("[done] No more items to process (within 24h window & empty summaries).")
+            if not pending:
                 break
 
-            # Begin a transaction for this batch
-            cur.execute("BEGIN")
-            try:
-                for mid, abstract in rows:
-                    # Check time limit frequently
-                    if time.time() - start >= MAX_SECONDS:
-                        print("[stop] Reached 5-hour limit mid-batch; committing progress.")
-                        break
-
-                    try:
-                        summary = summarize_novelty_list(abstract)
-                        # If model returns empty, leave the field empty for a future run
-                        if summary:
-                            cur.execute(UPDATE_SQL, (summary, mid))
-                            processed += 1
-                            #print(f"[ok] {mid} :: {summary[:80].replace('\\n', ' ')}{'...' if len(summary) > 80 else ''}")
-                        else:
-                            print(f"[skip-empty] {mid} :: model returned empty summary")
-                    except Exception as e:
-                        failures += 1
-                        print(f"[fail] {mid} :: {e}")
-
-                # Commit whatever we managed in this batch
-                conn.commit()
-
-                # Small breather to be nice to the server (adjust as needed)
-                time.sleep(0.2)
-
-            except Exception as e:
-                # Roll back the batch on unexpected DB errors
-                conn.rollback()
-                print(f"[rollback] Batch failed: {e}")
-                # brief pause before retrying next fetch
-                time.sleep(1)
+            completed, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in completed:
+                n = pending.pop(future)
+                try:
+                    done, errors = future.result()
+                except Exception as e:
+                    failures += n
+                    print(f"[fail] {n} abstract(s) :: {e}")
+                    continue
+                for mid, e in errors.items():
+                    failures += 1
+                    print(f"[fail] {mid} :: {e}")
+                for mid, (summary, key) in done.items():
+                    # If model returns empty, leave the field empty for a future run
+                    if summary:
+                        results.append((summary, mid, key))
+                        processed += 1
+                    else:
+                        print(f"[skip-empty] {mid} :: model returned empty summary")
+
+            if len(results) >= COMMIT_EVERY:
+                write_summaries(conn, results)
+    finally:
+        # Keep whatever finished, also on Ctrl-C
+        pool.shutdown(wait=False, cancel_futures=True)
+        write_summaries(conn, results)
+        evicted = cache.evict()
+        conn.close()
 
     elapsed = time.time() - start
-    print(f"[summary] processed={processed}, failures={failures}, wall={elapsed:.1f}s")
+    rate = processed / elapsed * 60 if elapsed else 0
+    print(f"[summary] processed={processed}, failures={failures}, wall={elapsed:.1f}s, {rate:.1f}/min")
+    print(f"[cache] hits={cache.hits}, misses={cache.misses}, evicted={evicted}")
+    print(f"[stream] {STATS.report()}")
 
 if __name__ == "__main__":
     try:
-        fill_summaries()
+        fill_summaries(only_matched=ONLY_MATCHED or "--only-matched" in sys.argv[1:])
     except KeyboardInterrupt:
         print("\n[stop] Interrupted by user.")
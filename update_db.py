@@ -1,16 +1,14 @@
 import os
-import sqlite3
-import json
-import feedparser
 from datetime import datetime, timedelta, timezone
-from time import mktime
-import time
+
+import ingest
+from arxiv_client import ARXIV_API_URL, fetch_stream
+from atom_parser import iter_papers
 
 # Config
 DB_PATH = os.path.join(os.path.dirname(__file__), "data", "manuscript_db.db")
 N_DAYS = 365
 BATCH_SIZE = 1000
-ARXIV_API_URL = "http://export.arxiv.org/api/query"
 
 # Search categories
 physics_categories = [ "astro-ph", "cond-mat.dis-nn", "cond-mat.mes-hall", "cond-mat.mtrl-sci", "cond-mat.other",
@@ -43,30 +41,42 @@ SEARCH_QUERIES = (
 # Ensure data directory exists
 os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 
+# `pk` aliases the rowid, so manuscripts_fts rowids and the filter watermarks in
+# filtering.py stay valid across VACUUM. AUTOINCREMENT keeps pruning the newest
+# rows from handing their pks out again, below those watermarks.
+# Older databases: see migrate_manuscripts_pk.py
 CREATE_TABLE_SQL = """
 CREATE TABLE IF NOT EXISTS manuscripts (
-    id TEXT PRIMARY KEY,
+    pk INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
     title TEXT NOT NULL,
     authors TEXT NOT NULL,
+    authors_display TEXT,
     orcids TEXT,
     keywords TEXT,
     abstract TEXT,
     link TEXT NOT NULL,
     published_timestamp TEXT NOT NULL,
-    added_timestamp TEXT NOT NULL
+    added_timestamp TEXT NOT NULL,
+    summary TEXT DEFAULT ''
 );
 """
 
 CREATE_FTS_SQL = """
 CREATE VIRTUAL TABLE IF NOT EXISTS manuscripts_fts USING fts5(
-    title, abstract, authors, keywords, content='manuscripts', content_rowid='id'
+    title, abstract, authors, keywords, content='manuscripts', content_rowid='pk'
 );
 """
 
+CREATE_INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS idx_manuscripts_added ON manuscripts(added_timestamp);
+"""
+
 def initialize_database():
-    with sqlite3.connect(DB_PATH) as conn:
+    with ingest.connect(DB_PATH) as conn:
         conn.execute(CREATE_TABLE_SQL)
         conn.execute(CREATE_FTS_SQL)
+        conn.execute(CREATE_INDEX_SQL)
     print(f"Database initialized at {DB_PATH}")
 
 def fetch_arxiv_papers_for_query(search_query, n_days, batch_size):
@@ -81,54 +91,35 @@ def fetch_arxiv_papers_for_query(search_query, n_days, batch_size):
             f"&sortBy=submittedDate&sortOrder=descending"
         )
 
-        print(f"\nFetching {search_query} results {start}–{start + batch_size - 1} ...")
-        feed = feedparser.parse(query)
-
-        if not feed.entries:
-            print("No more entries returned from arXiv.")
-            break
-
+        print(f"Fetching {search_query} results {start}–{start + batch_size - 1} ...")
         batch_papers = []
         all_older = True
-
-        for entry in feed.entries:
-            published_dt = datetime.fromtimestamp(mktime(entry.published_parsed), tz=timezone.utc)
-
+        n_entries = 0
+        first_date = last_date = None
+
+        # Entries are parsed as the page downloads
+        for published_dt, paper in iter_papers(fetch_stream(query)):
+            n_entries += 1
+            first_date = first_date or published_dt
+            last_date = published_dt
             if published_dt >= cutoff:
                 all_older = False
-                arxiv_id = entry.id.split('/')[-1]
-                title = entry.title.strip().replace('\n', ' ')
-                abstract = entry.summary.strip().replace('\n', ' ')
-                authors = [author.name for author in entry.authors]
-                keywords = [tag['term'] for tag in entry.tags] if 'tags' in entry else []
-                link = entry.link
-
-                batch_papers.append({
-                    "id": arxiv_id,
-                    "title": title,
-                    "authors": json.dumps(authors),
-                    "orcids": json.dumps([]),
-                    "keywords": json.dumps(keywords),
-                    "abstract": abstract,
-                    "link": link,
-                    "published_timestamp": published_dt.isoformat(),
-                    "added_timestamp": datetime.now(timezone.utc).isoformat()
-                })
-
-        if feed.entries:
-            first_date = datetime.fromtimestamp(mktime(feed.entries[0].published_parsed))
-            last_date = datetime.fromtimestamp(mktime(feed.entries[-1].published_parsed))
-            print(f"Batch covers: {first_date.date()} → {last_date.date()}")
+                batch_papers.append(paper)
+
+        if not n_entries:
+            print(f"[{search_query}] No more entries returned from arXiv.")
+            break
+
+        print(f"[{search_query}] Batch covers: {first_date.date()} → {last_date.date()}")
 
         all_new_papers.extend(batch_papers)
-        print(f"Fetched {len(feed.entries)} → Keeping {len(batch_papers)}")
+        print(f"[{search_query}] Fetched {n_entries} → Keeping {len(batch_papers)}")
 
         if all_older:
-            print("All entries in this batch are older than cutoff — stopping.")
+            print(f"[{search_query}] All entries in this batch are older than cutoff — stopping.")
             break
 
         start += batch_size
-        time.sleep(1)
 
     return all_new_papers
 
@@ -137,35 +128,8 @@ def insert_papers_to_db(papers):
         print("No new papers to insert.")
         return
 
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        new_count = 0
-        for paper in papers:
-            try:
-                cursor.execute("""
-                    INSERT INTO manuscripts (
-                        id, title, authors, orcids, keywords, abstract,
-                        link, published_timestamp, added_timestamp
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    paper["id"], paper["title"], paper["authors"],
-                    paper["orcids"], paper["keywords"], paper["abstract"],
-                    paper["link"], paper["published_timestamp"], paper["added_timestamp"]
-                ))
-
-                cursor.execute("""
-                    INSERT INTO manuscripts_fts (rowid, title, abstract, authors, keywords)
-                    VALUES ((SELECT rowid FROM manuscripts WHERE id = ?), ?, ?, ?, ?)
-                """, (
-                    paper["id"], paper["title"], paper["abstract"],
-                    paper["authors"], paper["keywords"]
-                ))
-
-                #print(f"  ✔ Inserted: {paper['published_timestamp'][:10]} | {paper['title'][:40]}")
-                new_count += 1
-            except sqlite3.IntegrityError:
-                continue  # Duplicate
-        conn.commit()
+    with ingest.connect(DB_PATH) as conn:
+        new_count = ingest.insert_papers(conn, papers)
     print(f"Inserted {new_count} new manuscript(s).")
 
 if __name__ == "__main__":
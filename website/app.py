@@ -13,11 +13,13 @@ from utils import t, COLORS
 from werkzeug.security import generate_password_hash
 from datetime import datetime
 from flask import current_app
+import db
 
 
 
 app = Flask(__name__)
 app.secret_key = "your_secret_key"
+db.init_app(app)
 
 # ----------------------------------
 # Ensure the users.db and folders exist
@@ -75,13 +77,10 @@ def register():
             return redirect(request.url)
 
         # Check if email already exists
-        conn = sqlite3.connect(USER_DB_PATH)
-        cur = conn.cursor()
-        cur.execute("SELECT id FROM users WHERE email = ?", (email,))
+        cur = db.user_db().execute("SELECT id FROM users WHERE email = ?", (email,))
         if cur.fetchone():
             flash(t("auth.email_exists", lang))
             return redirect(request.url)
-        conn.close()
 
         # Generate and send code
         code = generate_code()
@@ -122,12 +121,9 @@ def verify_registration():
 
         if verify_code(email, code):
             pwd_hash = generate_password_hash(password, method="pbkdf2:sha256", salt_length=16)
-            conn = sqlite3.connect(USER_DB_PATH)
-            cur = conn.cursor()
-            cur.execute("INSERT INTO users (email, password) VALUES (?, ?)", (email, pwd_hash))
-            conn.commit()
+            with db.user_db() as conn:
+                cur = conn.execute("INSERT INTO users (email, password) VALUES (?, ?)", (email, pwd_hash))
             user_id = cur.lastrowid
-            conn.close()
 
             os.makedirs(os.path.join(USERS_ROOT, f"user_{user_id}"), exist_ok=True)
             session.pop("pending_email", None)
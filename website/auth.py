@@ -1,8 +1,9 @@
 # auth.py  – secure password storage / verification
 from flask import Blueprint, request, redirect, url_for, render_template_string, session, flash
 from werkzeug.security import generate_password_hash, check_password_hash
-import sqlite3, os
-from config import USER_DB_PATH, USERS_ROOT
+import os
+from config import USERS_ROOT
+from db import user_db
 import smtplib
 import secrets
 from email.message import EmailMessage
@@ -29,13 +30,8 @@ EMAIL_PASSWORD = os.getenv("GMAIL_APP_PASSWORD")
 # Helper: fetch (email, hashed_pwd, id)  --------------------------- #
 # ------------------------------------------------------------------ #
 def get_user(email: str):
-    conn = sqlite3.connect(USER_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-    cur.execute("SELECT email, password, id FROM users WHERE email = ?", (email,))
-    row = cur.fetchone()
-    conn.close()
-    return row  # None if not found
+    cur = user_db().execute("SELECT email, password, id FROM users WHERE email = ?", (email,))
+    return cur.fetchone()  # None if not found
 
 def send_email(to_email, subject, plain_body, html_main_paragraph=None):
     """Send email with styled HTML body and plain fallback."""
@@ -102,11 +98,8 @@ def forgot_password():
         new_pw = secrets.token_urlsafe(8)  # generates 11-char safe password
         new_hash = generate_password_hash(new_pw)
 
-        conn = sqlite3.connect(USER_DB_PATH)
-        cur = conn.cursor()
-        cur.execute("UPDATE users SET password = ? WHERE email = ?", (new_hash, email))
-        conn.commit()
-        conn.close()
+        with user_db() as conn:
+            conn.execute("UPDATE users SET password = ? WHERE email = ?", (new_hash, email))
 
         try:
             subject = t("email.reset_password_subject", lang)
@@ -203,11 +196,8 @@ def change_password():
             return redirect(request.url)
 
         new_hash = generate_password_hash(new, method="pbkdf2:sha256", salt_length=16)
-        conn = sqlite3.connect(USER_DB_PATH)
-        cur = conn.cursor()
-        cur.execute("UPDATE users SET password = ? WHERE id = ?", (new_hash, session["user_id"]))
-        conn.commit()
-        conn.close()
+        with user_db() as conn:
+            conn.execute("UPDATE users SET password = ? WHERE id = ?", (new_hash, session["user_id"]))
 
         flash(t("auth.password_changed_successfully", lang))
         return redirect(url_for("filters.filters_home"))
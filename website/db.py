@@ -0,0 +1,100 @@
+"""
+Pooled SQLite connections for the website.
+
+Opening a connection costs a file open and a schema parse, and every handler
+used to pay that per request. Here each database has a small pool of idle
+connections. A request checks one out on first use (user_db() / main_db()),
+keeps it for its lifetime, and the app-context teardown hands it back. A
+connection is only ever used by one thread at a time. The pool is not keyed
+on threads because the development server starts a new thread for every
+request, so thread-locals would never be reused.
+
+users.db is opened read-write in WAL mode, so logins keep reading while a
+registration commits. The corpus is opened read-only; the harvesters own it.
+"""
+import sqlite3
+import threading
+
+from flask import g
+
+import config
+
+POOL_SIZE = 16  # idle connections kept per database
+
+PRAGMAS = (
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",   # 256 MiB of the file read through the page cache, not read()
+)
+
+def connect(path, read_only=False):
+    if read_only:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+class ConnectionPool:
+    """Idle connections to one database, handed out to one request at a time."""
+
+    def __init__(self, path, read_only=False, size=POOL_SIZE):
+        self.path = path
+        self.read_only = read_only
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    def acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            self.opened += 1
+        return connect(self.path, self.read_only)
+
+    def release(self, conn):
+        # Whatever a failed handler left uncommitted must not leak into the next request
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def _pool(path, read_only):
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            pool = _pools[path] = ConnectionPool(path, read_only, POOL_SIZE)
+        return pool
+
+def _connection(path, read_only):
+    held = g.setdefault("sqlite_connections", {})
+    conn = held.get(path)
+    if conn is None:
+        conn = held[path] = _pool(path, read_only).acquire()
+    return conn
+
+def user_db():
+    """This request's read-write connection to users.db."""
+    return _connection(config.USER_DB_PATH, read_only=False)
+
+def main_db():
+    """This request's read-only connection to the manuscript corpus."""
+    return _connection(config.MAIN_DB_PATH, read_only=True)
+
+def release_connections(exc=None):
+    for path, conn in g.pop("sqlite_connections", {}).items():
+        _pools[path].release(conn)
+
+def init_app(app):
+    app.teardown_appcontext(release_connections)
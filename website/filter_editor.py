@@ -2,12 +2,12 @@ import os
 import json
 import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-import sqlite3
 from flask import Blueprint, request, redirect, url_for, render_template, session, flash, jsonify
 from datetime import datetime, timedelta
-from config import USERS_ROOT, MAIN_DB_PATH, USER_DB_PATH
+from config import USERS_ROOT
 from utils import t, COLORS
-import sqlite3
+from preview import preview
+from db import user_db
 
 def build_fts_query_from_filter(filter_data):
     groups = filter_data.get("keyword_groups", [])
@@ -54,10 +54,14 @@ def edit_filter(filter_name=None):
             "keyword_groups": keyword_groups
         }
 
-        if old_filter != new_filter:
+        # Changed keywords are re-matched against the whole corpus by filtering.py
+        if old_filter.get("keyword_groups") != new_filter["keyword_groups"]:
             new_filter["last_scan"] = (datetime.now() - timedelta(days=365*20)).isoformat()
+            new_filter["last_rowid"] = 0
         else:
             new_filter["last_scan"] = old_filter.get("last_scan", "")
+            if "last_rowid" in old_filter:
+                new_filter["last_rowid"] = old_filter["last_rowid"]
 
         save_path = os.path.join(user_dir, f"filter_{name}.json")
         with open(save_path, "w", encoding="utf-8") as f:
@@ -65,10 +69,8 @@ def edit_filter(filter_name=None):
 
         # ------------- NEW: Save language to users.db ------------- #
         lang = session.get("lang", "en")
-        with sqlite3.connect(USER_DB_PATH) as conn:
-            cursor = conn.cursor()
-            cursor.execute("UPDATE users SET lang = ? WHERE id = ?", (lang, user_id))
-            conn.commit()
+        with user_db() as conn:
+            conn.execute("UPDATE users SET lang = ? WHERE id = ?", (lang, user_id))
 
         return redirect(url_for("filters.filters_home"))
 
@@ -113,19 +115,4 @@ def test_filter():
         print("[DEBUG] No valid FTS query could be built.")
         return jsonify({"matches": 0, "titles": []})
 
-    with sqlite3.connect(MAIN_DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT title FROM manuscripts_fts
-            WHERE manuscripts_fts MATCH ?
-        """, (fts_query,))
-        titles = [row["title"] for row in cursor.fetchall() if "title" in row.keys()]
-
-    count = len(titles)
-    sample_titles = titles[:5]
-
-    return jsonify({
-        "matches": count,
-        "titles": sample_titles
-    })
+    return jsonify(preview(filter_data["keyword_groups"], fts_query))
@@ -0,0 +1,92 @@
+"""
+Result preview for the filter editor (/filters/check).
+
+The count and the sample are computed in SQL (count(*) and ORDER BY ... LIMIT
+on the FTS table), so matches are never pulled into Python. Results are kept in
+a small LRU per normalized filter with a TTL, and are only valid for the corpus
+version they were computed on: the lowest and highest manuscripts.pk, which
+move with every harvest and prune. Identical previews that arrive while one is
+being computed wait for that one instead of running the query again.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from db import main_db
+
+SAMPLE_SIZE = 5
+CACHE_SIZE = 1024
+CACHE_TTL = 600  # seconds
+
+def normalize(keyword_groups):
+    """Cache key: the same filter regardless of keyword order, case and spacing."""
+    return tuple(sorted(
+        tuple(sorted({" ".join(kw.strip('"').split()).lower() for kw in group}))
+        for group in keyword_groups
+    ))
+
+def corpus_version(conn):
+    # Two separate MIN/MAX subqueries, so each is a single b-tree probe
+    return conn.execute("""
+        SELECT (SELECT MIN(pk) FROM manuscripts), (SELECT MAX(pk) FROM manuscripts)
+    """).fetchone()
+
+def run_preview(conn, fts_query):
+    count = conn.execute("""
+        SELECT count(*) FROM manuscripts_fts WHERE manuscripts_fts MATCH ?
+    """, (fts_query,)).fetchone()[0]
+    # Newest first: FTS5 walks rowids backwards and stops after the sample
+    titles = [row[0] for row in conn.execute("""
+        SELECT title FROM manuscripts_fts WHERE manuscripts_fts MATCH ?
+        ORDER BY rowid DESC LIMIT ?
+    """, (fts_query, SAMPLE_SIZE))]
+    return {"matches": count, "titles": titles}
+
+class PreviewCache:
+    """Thread-safe LRU with a TTL; an entry is only served for the version it was computed on."""
+
+    def __init__(self, size=CACHE_SIZE, ttl=CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (version, stored at, result)
+        self._inflight = {}            # key -> Event set when its computation ends
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version, compute):
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry and entry[0] == version and time.monotonic() - entry[1] < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[2]
+                running = self._inflight.get(key)
+                if running is None:
+                    done = self._inflight[key] = threading.Event()
+                    self.misses += 1
+                    break
+            # Someone is already computing this preview; look again once they finish
+            running.wait()
+
+        try:
+            result = compute()
+            with self._lock:
+                self._entries[key] = (version, time.monotonic(), result)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.size:
+                    self._entries.popitem(last=False)
+            return result
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            done.set()
+
+PREVIEWS = PreviewCache()
+
+def preview(keyword_groups, fts_query):
+    """{"matches": count, "titles": newest SAMPLE_SIZE titles} for a filter."""
+    conn = main_db()
+    return PREVIEWS.get(normalize(keyword_groups), corpus_version(conn),
+                        lambda: run_preview(conn, fts_query))